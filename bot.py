@@ -6,6 +6,8 @@ from config import config
 from handlers import register_handlers
 from rss import setup as setup_rss
 from database.db_manager import DatabaseManager
+from services import spam_classifier, ai_scheduler, challenge_pool, topic_health, topic_pool, update_processor, message_map
+from services.send_scheduler import send_scheduler
 
 async def post_init(app: Application):
     config.BOT_ID = app.bot.id
@@ -22,10 +24,24 @@ def main():
     db_manager = DatabaseManager(config.DATABASE_PATH)
     asyncio.run(db_manager.initialize())
     
-    app = Application.builder().token(config.BOT_TOKEN).post_init(post_init).build()
+    app = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .rate_limiter(send_scheduler)
+        .concurrent_updates(update_processor.update_processor)
+        .post_init(post_init)
+        .build()
+    )
     
     register_handlers(app)
     setup_rss(app)
+    spam_classifier.setup(app)
+    ai_scheduler.setup(app)
+    challenge_pool.setup(app)
+    topic_health.setup(app)
+    topic_pool.setup(app)
+    update_processor.setup(app)
+    message_map.setup(app)
     
     config.validate()
     
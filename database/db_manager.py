@@ -31,6 +31,8 @@ class DatabaseManager:
             await self.create_filtered_messages_table(db)
             await self.create_knowledge_base_table(db)
             await self.create_exemptions_table(db)
+            await self.create_topic_pool_table(db)
+            await self.create_message_map_table(db)
             await self.migrate_database(db)
             await db.commit()
         logging.info("数据库初始化完成。")
@@ -219,6 +221,27 @@ class DatabaseManager:
         await db.execute('CREATE INDEX IF NOT EXISTS idx_exemptions_expires ON exemptions(expires_at)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_exemptions_permanent ON exemptions(is_permanent)')
 
+    async def create_topic_pool_table(self, db):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS topic_pool (
+                thread_id INTEGER PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    async def create_message_map_table(self, db):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS message_map (
+                user_id INTEGER NOT NULL,
+                user_message_id INTEGER NOT NULL,
+                forum_message_id INTEGER NOT NULL,
+                thread_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, user_message_id)
+            )
+        ''')
+        await db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_message_map_forum ON message_map(forum_message_id)')
+
     async def get_filtered_messages_by_user(self, user_id, limit=5):
         async with self.get_connection() as db:
             cursor = await db.execute(
@@ -243,6 +266,34 @@ class DatabaseManager:
             if "duplicate column name" not in str(e):
                 raise e
 
+        try:
+            await db.execute('ALTER TABLE users ADD COLUMN clean_messages INTEGER DEFAULT 0 NOT NULL')
+            logging.info("数据库迁移：成功为 'users' 表添加 'clean_messages' 列。")
+        except aiosqlite.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                raise e
+
+        try:
+            await db.execute('ALTER TABLE messages ADD COLUMN verdict_source TEXT')
+            logging.info("数据库迁移：成功为 'messages' 表添加 'verdict_source' 列。")
+        except aiosqlite.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                raise e
+
+        try:
+            await db.execute('ALTER TABLE filtered_messages ADD COLUMN verdict_source TEXT')
+            await db.execute('''
+                UPDATE filtered_messages SET verdict_source = CASE reason
+                    WHEN '本地模型判定为垃圾信息。' THEN 'local'
+                    WHEN '管理员标记为垃圾信息' THEN 'admin'
+                    ELSE 'llm'
+                END
+            ''')
+            logging.info("数据库迁移：成功为 'filtered_messages' 表添加 'verdict_source' 列。")
+        except aiosqlite.OperationalError as e:
+            if "duplicate column name" not in str(e):
+                raise e
+
         try:
             await db.execute(
                 'INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)',
@@ -269,4 +320,29 @@ class DatabaseManager:
         except Exception as e:
             logging.warning(f"添加AI设置时出错: {e}")
 
+        try:
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('local_classifier_enabled', '1', '是否启用本地垃圾信息分类器 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_cascade_enabled', '1', '是否先用验证码模型快速审查，低置信度时再升级到审查模型 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_batch_enabled', '0', '是否将并发的纯文本审查请求合并为一次AI请求 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_batch_window_ms', '150', '批量审查的最长等待时间（毫秒）'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_batch_max_size', '8', '单个批量审查请求包含的最大消息数'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('knowledge_base_version', '0', '知识库版本号，每次增删改条目时递增'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_hedge_enabled', '0', '主提供商响应超过其p95延迟时是否同时请求备用提供商 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('ai_call_timeout', '30', '单次AI提供商调用的超时时间（秒，不含排队时间），超时计为该提供商的一次失败'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('challenge_pool_size', '20', '预先生成的验证问题数量'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('verification_provider', 'ai', '验证问题来源 (ai=AI生成, local=本地生成)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('knowledge_top_k', '3', '自动回复时检索的知识库条目数量上限'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('knowledge_min_score', '0', '知识库条目的最低相关度 (0~1，相对于问题自身的匹配得分)，低于此值时不调用AI自动回复 (0=有任何匹配即可)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('autoreply_streaming', '1', '是否以流式逐步编辑的方式发送自动回复 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('trust_fast_path_enabled', '1', '是否对可信用户先转发、后台再审查 (1=是, 0=否)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('trust_min_clean_messages', '20', '成为可信用户所需的审查通过消息数'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('trust_min_age_days', '7', '成为可信用户所需的首次联系后天数'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('moderation_status_mode', 'action', '审查时的提示方式 (action=显示“正在输入”，超时后才发送提示消息, message=始终发送提示消息)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('moderation_status_budget_ms', '1500', '审查超过该时长（毫秒）后才发送可见的提示消息'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('topic_pool_size', '3', '预先创建的空闲话题数量，新用户首次联系时直接分配 (0=禁用)'))
+            await db.execute('INSERT OR IGNORE INTO settings (key, value, description) VALUES (?, ?, ?)', ('burst_coalesce_ms', '0', '将该时间窗口（毫秒）内连续发送的纯文本消息合并为一条审查和转发 (0=禁用)'))
+            logging.info("数据库迁移：成功添加AI性能设置。")
+        except Exception as e:
+            logging.warning(f"添加AI性能设置时出错: {e}")
+
 db_manager = DatabaseManager()
@@ -38,6 +38,51 @@ async def update_user_thread_id(user_id: int, thread_id: int):
         )
         await db.commit()
 
+async def increment_clean_messages(user_id: int):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            'UPDATE users SET clean_messages = clean_messages + 1 WHERE user_id = ?',
+            (user_id,)
+        )
+        await db.commit()
+
+async def decay_clean_messages(user_id: int, factor: int):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            'UPDATE users SET clean_messages = clean_messages / ? WHERE user_id = ?',
+            (factor, user_id)
+        )
+        await db.commit()
+
+async def get_all_thread_ids() -> list:
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            'SELECT thread_id FROM users WHERE thread_id IS NOT NULL'
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+async def add_pooled_topic(thread_id: int):
+    async with db_manager.get_connection() as db:
+        await db.execute('INSERT OR IGNORE INTO topic_pool (thread_id) VALUES (?)', (thread_id,))
+        await db.commit()
+
+async def claim_pooled_topic() -> int:
+    async with db_manager.get_connection() as db:
+        async with db.execute('SELECT thread_id FROM topic_pool ORDER BY created_at, thread_id LIMIT 1') as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return None
+        await db.execute('DELETE FROM topic_pool WHERE thread_id = ?', (row[0],))
+        await db.commit()
+        return row[0]
+
+async def get_pooled_topic_count() -> int:
+    async with db_manager.get_connection() as db:
+        async with db.execute('SELECT COUNT(*) FROM topic_pool') as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
 async def get_user_by_thread_id(thread_id: int):
     async with db_manager.get_connection() as db:
         async with db.execute(
@@ -49,22 +94,62 @@ async def get_user_by_thread_id(thread_id: int):
                 return dict(zip([col[0] for col in cursor.description], row))
             return None
 
-async def save_message(user_id: int, message_id: int, content: str, direction: str, media_type: str = None, media_file_id: str = None):
+async def save_message_mapping(user_id: int, user_message_id: int, forum_message_id: int, thread_id: int):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            'INSERT OR REPLACE INTO message_map (user_id, user_message_id, forum_message_id, thread_id) VALUES (?, ?, ?, ?)',
+            (user_id, user_message_id, forum_message_id, thread_id)
+        )
+        await db.commit()
+
+async def get_mapping_by_user_message(user_id: int, user_message_id: int):
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            'SELECT user_id, user_message_id, forum_message_id, thread_id FROM message_map WHERE user_id = ? AND user_message_id = ?',
+            (user_id, user_message_id)
+        ) as cursor:
+            return await cursor.fetchone()
+
+async def get_mapping_by_forum_message(forum_message_id: int):
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            'SELECT user_id, user_message_id, forum_message_id, thread_id FROM message_map WHERE forum_message_id = ?',
+            (forum_message_id,)
+        ) as cursor:
+            return await cursor.fetchone()
+
+async def prune_message_mappings(retention_days: int):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            "DELETE FROM message_map WHERE created_at < datetime('now', ?)",
+            (f'-{retention_days} days',)
+        )
+        await db.commit()
+
+async def save_message(user_id: int, message_id: int, content: str, direction: str, media_type: str = None, media_file_id: str = None, verdict_source: str = None):
     async with db_manager.get_connection() as db:
         await db.execute('''
             INSERT INTO messages
-            (user_id, message_id, content, direction, media_type, media_file_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, message_id, content, direction, media_type, media_file_id))
+            (user_id, message_id, content, direction, media_type, media_file_id, verdict_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, message_id, content, direction, media_type, media_file_id, verdict_source))
         await db.commit()
 
-async def save_filtered_message(user_id: int, message_id: int, content: str, reason: str, media_type: str = None, media_file_id: str = None):
+async def set_message_verdict_source(user_id: int, message_id: int, verdict_source: str):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            "UPDATE messages SET verdict_source = ? WHERE user_id = ? AND message_id = ? AND direction = 'incoming'",
+            (verdict_source, user_id, message_id)
+        )
+        await db.commit()
+
+async def save_filtered_message(user_id: int, message_id: int, content: str, reason: str, media_type: str = None, media_file_id: str = None, verdict_source: str = None):
     async with db_manager.get_connection() as db:
         await db.execute('''
             INSERT INTO filtered_messages
-            (user_id, message_id, content, reason, media_type, media_file_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, message_id, content, reason, media_type, media_file_id))
+            (user_id, message_id, content, reason, media_type, media_file_id, verdict_source)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, message_id, content, reason, media_type, media_file_id, verdict_source))
         await db.commit()
 
 async def get_filtered_messages(limit: int = 20, offset: int = 0):
@@ -82,6 +167,76 @@ async def get_filtered_messages(limit: int = 20, offset: int = 0):
             cols = [description[0] for description in cursor.description]
             return [dict(zip(cols, row)) for row in rows]
 
+async def get_filtered_message(filtered_id: int):
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            'SELECT * FROM filtered_messages WHERE id = ?',
+            (filtered_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return dict(zip([col[0] for col in cursor.description], row))
+            return None
+
+async def delete_filtered_message(filtered_id: int):
+    async with db_manager.get_connection() as db:
+        await db.execute('DELETE FROM filtered_messages WHERE id = ?', (filtered_id,))
+        await db.commit()
+
+async def delete_incoming_message(user_id: int, message_id: int):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            "DELETE FROM messages WHERE user_id = ? AND message_id = ? AND direction = 'incoming'",
+            (user_id, message_id)
+        )
+        await db.commit()
+
+async def get_spam_training_samples(sources: tuple, limit: int = 5000) -> list:
+    placeholders = ', '.join('?' * len(sources))
+    async with db_manager.get_connection() as db:
+        async with db.execute(f'''
+            SELECT content FROM filtered_messages
+            WHERE content IS NOT NULL AND content != '' AND verdict_source IN ({placeholders})
+            ORDER BY filtered_at DESC
+            LIMIT ?
+        ''', (*sources, limit)) as cursor:
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+async def get_ham_training_samples(sources: tuple, limit: int = 5000) -> list:
+    placeholders = ', '.join('?' * len(sources))
+    async with db_manager.get_connection() as db:
+        async with db.execute(f'''
+            SELECT content FROM messages
+            WHERE direction = 'incoming' AND content IS NOT NULL AND content != '' AND verdict_source IN ({placeholders})
+            ORDER BY created_at DESC
+            LIMIT ?
+        ''', (*sources, limit)) as cursor:
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+async def prune_incoming_messages(sources: tuple, keep: int, retention_days: int):
+    placeholders = ', '.join('?' * len(sources))
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            "DELETE FROM messages WHERE direction = 'incoming' AND created_at < datetime('now', ?)",
+            (f'-{retention_days} days',)
+        )
+        await db.execute(f'''
+            DELETE FROM messages
+            WHERE direction = 'incoming' AND verdict_source IS NOT NULL AND verdict_source NOT IN ({placeholders})
+        ''', sources)
+        await db.execute(f'''
+            DELETE FROM messages
+            WHERE direction = 'incoming' AND verdict_source IN ({placeholders}) AND id NOT IN (
+                SELECT id FROM messages
+                WHERE direction = 'incoming' AND verdict_source IN ({placeholders})
+                ORDER BY id DESC
+                LIMIT ?
+            )
+        ''', (*sources, *sources, keep))
+        await db.commit()
+
 async def get_filtered_messages_count() -> int:
     async with db_manager.get_connection() as db:
         async with db.execute('SELECT COUNT(*) FROM filtered_messages') as cursor:
@@ -249,6 +404,7 @@ async def add_knowledge_entry(title: str, content: str):
             INSERT INTO knowledge_base (title, content, updated_at)
             VALUES (?, ?, CURRENT_TIMESTAMP)
         ''', (title, content))
+        await _bump_knowledge_base_version(db)
         await db.commit()
 
 async def get_all_knowledge_entries():
@@ -284,24 +440,57 @@ async def update_knowledge_entry(knowledge_id: int, title: str, content: str):
             SET title = ?, content = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (title, content, knowledge_id))
+        await _bump_knowledge_base_version(db)
         await db.commit()
 
 async def delete_knowledge_entry(knowledge_id: int):
     async with db_manager.get_connection() as db:
         await db.execute('DELETE FROM knowledge_base WHERE id = ?', (knowledge_id,))
+        await _bump_knowledge_base_version(db)
         await db.commit()
 
-async def get_all_knowledge_content() -> str:
-    entries = await get_all_knowledge_entries()
-    if not entries:
-        return ""
-    
-    knowledge_text = "知识库内容：\n\n"
+async def _bump_knowledge_base_version(db):
+    await db.execute(
+        "UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'knowledge_base_version'"
+    )
+
+async def get_knowledge_base_version() -> int:
+    return int(await get_setting('knowledge_base_version', '0'))
+
+def format_knowledge_entries(entries: list) -> str:
+    parts = ["知识库内容：\n\n"]
     for entry in entries:
-        knowledge_text += f"标题：{entry['title']}\n"
-        knowledge_text += f"内容：{entry['content']}\n\n"
-    
-    return knowledge_text
+        parts.append(f"标题：{entry['title']}\n内容：{entry['content']}\n\n")
+    return "".join(parts)
+
+async def get_setting(key: str, default: str = None) -> str:
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            'SELECT value FROM settings WHERE key = ?',
+            (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return row[0]
+            return default
+
+async def set_setting(key: str, value: str):
+    async with db_manager.get_connection() as db:
+        await db.execute(
+            'UPDATE settings SET value = ? WHERE key = ?',
+            (value, key)
+        )
+        await db.commit()
+
+async def get_settings(keys: list) -> dict:
+    placeholders = ','.join('?' for _ in keys)
+    async with db_manager.get_connection() as db:
+        async with db.execute(
+            f'SELECT key, value FROM settings WHERE key IN ({placeholders})',
+            tuple(keys)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return {row[0]: row[1] for row in rows}
 
 async def get_autoreply_enabled() -> bool:
     async with db_manager.get_connection() as db:
@@ -1,8 +1,8 @@
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
 from .command_handler import start, help_command, block, unblock, blacklist, stats, getid, autoreply, panel, exempt
-from .user_handler import handle_message
+from .user_handler import handle_message, handle_edited_message
 from .callback_handler import handle_callback
-from .admin_handler import handle_admin_reply, view_filtered
+from .admin_handler import handle_admin_reply, handle_admin_edit, handle_topic_status, view_filtered, not_spam, mark_spam
 from config import config
 from network_test.commands import (
     ping_command, nexttrace_command, add_user_command, rm_user_command,
@@ -29,9 +29,27 @@ def register_handlers(app: Application):
         app.add_handler(CommandHandler("blacklist", blacklist))
         app.add_handler(CommandHandler("stats", stats))
         app.add_handler(CommandHandler("view_filtered", view_filtered))
+        app.add_handler(CommandHandler("notspam", not_spam))
+        app.add_handler(CommandHandler("spam", mark_spam))
         app.add_handler(CommandHandler("autoreply", autoreply))
         app.add_handler(CommandHandler("exempt", exempt))
         
+        app.add_handler(MessageHandler(
+            filters.UpdateType.EDITED_MESSAGE & filters.ChatType.PRIVATE,
+            handle_edited_message
+        ))
+        
+        app.add_handler(MessageHandler(
+            filters.UpdateType.EDITED_MESSAGE & filters.Chat(chat_id=config.FORUM_GROUP_ID),
+            handle_admin_edit
+        ))
+        
+        app.add_handler(MessageHandler(
+            filters.Chat(chat_id=config.FORUM_GROUP_ID) &
+            (filters.StatusUpdate.FORUM_TOPIC_CLOSED | filters.StatusUpdate.FORUM_TOPIC_REOPENED),
+            handle_topic_status
+        ))
+        
         app.add_handler(MessageHandler(
             filters.Chat(chat_id=config.FORUM_GROUP_ID) & filters.REPLY & ~filters.COMMAND,
             handle_admin_reply
@@ -39,7 +57,8 @@ def register_handlers(app: Application):
         
         app.add_handler(MessageHandler(
             (filters.TEXT | filters.PHOTO | filters.VIDEO | filters.AUDIO | filters.VOICE |
-             filters.Document.ALL | filters.Sticker.ALL | filters.ANIMATION) &
+             filters.Document.ALL | filters.Sticker.ALL | filters.ANIMATION | filters.VIDEO_NOTE |
+             filters.POLL | filters.CONTACT | filters.LOCATION | filters.Dice.ALL) &
             ~filters.COMMAND & filters.ChatType.PRIVATE,
             handle_message
         ))
@@ -1,10 +1,26 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from database import models as db
-from utils.message_sender import send_message_by_type
+from telegram.error import BadRequest
+from utils.message_sender import relay_message, sync_edit
+from utils.decorators import admin_only
+from services.spam_classifier import spam_classifier
+from services.topic_health import topic_health
+from services.message_map import message_map
 
 async def _send_reply_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    await send_message_by_type(context.bot, update.message, user_id, None, True)
+    message = update.message
+    thread_id = message.message_thread_id
+    reply_to_message_id = None
+    replied = message.reply_to_message
+    if replied and replied.message_id != thread_id:
+        mapped = await message_map.get_user_message(replied.message_id)
+        if mapped and mapped[0] == user_id:
+            reply_to_message_id = mapped[1]
+
+    sent_msg = await relay_message(context.bot, message, user_id, None, True, reply_to_message_id)
+    if sent_msg:
+        await message_map.record(user_id, sent_msg.message_id, message.message_id, thread_id)
 
 async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message or not update.message.is_topic_message:
@@ -20,6 +36,31 @@ async def handle_admin_reply(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     await _send_reply_to_user(update, context, user_id)
 
+async def handle_admin_edit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.edited_message
+    if not message or not message.is_topic_message:
+        return
+
+    mapped = await message_map.get_user_message(message.message_id)
+    if not mapped:
+        return
+
+    user_id, user_message_id = mapped
+    try:
+        await sync_edit(context.bot, message, user_id, user_message_id)
+    except BadRequest as e:
+        print(f"同步管理员编辑失败: {e}")
+
+async def handle_topic_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    if not message or not message.message_thread_id:
+        return
+
+    if message.forum_topic_closed:
+        topic_health.mark_dead(message.message_thread_id, 'closed_events')
+    elif message.forum_topic_reopened:
+        topic_health.revive(message.message_thread_id)
+
 async def _format_filtered_messages(messages, page: int, total_pages: int):
     response = f"被过滤的消息 (第 {page}/{total_pages} 页):\n\n"
     
@@ -34,7 +75,7 @@ async def _format_filtered_messages(messages, page: int, total_pages: int):
             content = content[:100] + "..."
         
         response += (
-            f"【{idx}】\n"
+            f"【{idx}】 ID: {msg.get('id')}\n"
             f"用户: {first_name} (@{username})\n"
             f"原因: {reason}\n"
             f"内容: {content}\n"
@@ -94,3 +135,59 @@ async def view_filtered(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(response, reply_markup=keyboard)
     else:
         await update.message.reply_text(response)
+
+@admin_only
+async def not_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        await update.message.reply_text("用法: /notspam <ID>\n\nID 可在 /view_filtered 列表中查看。")
+        return
+
+    try:
+        filtered_id = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("无效的ID。")
+        return
+
+    filtered = await db.get_filtered_message(filtered_id)
+    if not filtered:
+        await update.message.reply_text(f"被过滤消息 {filtered_id} 不存在。")
+        return
+
+    await db.delete_filtered_message(filtered_id)
+    if filtered.get('content'):
+        await db.save_message(filtered['user_id'], filtered['message_id'], filtered['content'], 'incoming', verdict_source='admin')
+        spam_classifier.learn(filtered['content'], False)
+    await update.message.reply_text(f"已将被过滤消息 {filtered_id} 标记为误判，本地分类器已更新。")
+
+@admin_only
+async def mark_spam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    if not message.is_topic_message or not message.reply_to_message:
+        await update.message.reply_text("请在用户话题中回复需要标记的消息并发送 /spam。")
+        return
+
+    target = message.reply_to_message
+    content = target.text or target.caption
+    if not content:
+        await update.message.reply_text("只能标记包含文本的消息。")
+        return
+
+    user = await db.get_user_by_thread_id(message.message_thread_id)
+    if not user:
+        await update.message.reply_text("无法找到该话题对应的用户。")
+        return
+
+    message_id = target.message_id
+    mapped = await message_map.get_user_message(target.message_id)
+    if mapped and mapped[0] == user['user_id']:
+        message_id = mapped[1]
+        await db.delete_incoming_message(user['user_id'], message_id)
+    await db.save_filtered_message(
+        user_id=user['user_id'],
+        message_id=message_id,
+        content=content,
+        reason="管理员标记为垃圾信息",
+        verdict_source='admin',
+    )
+    spam_classifier.learn(content, True)
+    await update.message.reply_text("已将该消息标记为垃圾信息，本地分类器已更新。")
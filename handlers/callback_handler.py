@@ -3,12 +3,25 @@ import secrets
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from services.verification import verify_answer, create_verification
-from services.gemini_service import gemini_service
+from services.verification import verify_answer, send_challenge
+from services.spam_classifier import spam_classifier
+from services.ai_scheduler import ai_scheduler
+from services.challenge_pool import challenge_pool
+from services.knowledge_index import knowledge_index
+from services.autoreply_cache import autoreply_cache
+from services.ai_service import ai_service
 from database import models as db
-from utils.media_converter import sticker_to_image
-from services.thread_manager import get_or_create_thread
-from .user_handler import _resend_message
+from services.media_processor import media_processor
+from services.media_group import media_group_collector
+from services.burst_coalescer import burst_coalescer
+from services.topic_health import topic_health
+from services.topic_pool import topic_pool
+from services.message_map import message_map
+from services.pending_queue import pending_queue
+from services.trust import trust_service
+from services.send_scheduler import send_scheduler
+from services.update_processor import update_processor
+from .user_handler import replay_pending_messages
 from config import config
 from rss import data_manager as rss_data_manager, settings as rss_settings
 from rss import enable_feature as rss_enable_feature, disable_feature as rss_disable_feature
@@ -208,6 +221,100 @@ def _build_rss_feed_detail(application, chat_id: str, feed_url: str):
 
     return "\n".join(lines), InlineKeyboardMarkup(keyboard_rows)
 
+async def _build_ai_settings_view():
+    async with db.db_manager.get_connection() as conn:
+        cursor = await conn.execute("""
+            SELECT key, value FROM settings 
+            WHERE key IN (
+                'ai_provider', 
+                'gemini_model_filter', 'gemini_model_verification', 'gemini_model_autoreply',
+                'openai_model_filter', 'openai_model_verification', 'openai_model_autoreply'
+            )
+        """)
+        settings = {row[0]: row[1] for row in await cursor.fetchall()}
+
+    current_provider = settings.get('ai_provider', 'gemini')
+    provider_name = "Gemini" if current_provider == 'gemini' else "OpenAI"
+
+    message = (
+        f"🤖 **AI 模型设置**\n\n"
+        f"当前提供商: `{provider_name}`\n\n"
+        f"**Gemini 模型**:\n"
+        f"• 审查: `{settings.get('gemini_model_filter', 'N/A')}`\n"
+        f"• 验证: `{settings.get('gemini_model_verification', 'N/A')}`\n"
+        f"• 回复: `{settings.get('gemini_model_autoreply', 'N/A')}`\n\n"
+        f"**OpenAI 模型**:\n"
+        f"• 审查: `{settings.get('openai_model_filter', 'N/A')}`\n"
+        f"• 验证: `{settings.get('openai_model_verification', 'N/A')}`\n"
+        f"• 回复: `{settings.get('openai_model_autoreply', 'N/A')}`\n\n"
+        f"**本地分类器**:\n"
+        f"{spam_classifier.get_report()}\n\n"
+        f"**审查级联**:\n"
+        f"{ai_service.get_cascade_report()}\n"
+        f"{ai_service.batcher.get_report()}\n"
+        f"{ai_service.get_coalesce_report()}\n"
+        f"{media_processor.get_report()}\n\n"
+        f"**提供商健康**:\n"
+        f"{ai_service.router.get_report()}\n\n"
+        f"**请求调度**:\n"
+        f"{ai_scheduler.get_report()}\n\n"
+        f"**验证题池**:\n"
+        f"{challenge_pool.get_report()}\n\n"
+        f"**知识库检索**:\n"
+        f"{knowledge_index.get_report()}\n"
+        f"{autoreply_cache.get_report()}\n\n"
+        f"请选择要配置的项目:"
+    )
+
+    keyboard = [
+        [
+            InlineKeyboardButton(f"{'✅ ' if current_provider == 'gemini' else ''}使用 Gemini", callback_data="ai_set_provider_gemini"),
+            InlineKeyboardButton(f"{'✅ ' if current_provider == 'openai' else ''}使用 OpenAI", callback_data="ai_set_provider_openai")
+        ],
+        [
+            InlineKeyboardButton("配置 Gemini 模型", callback_data="ai_config_models_gemini"),
+            InlineKeyboardButton("配置 OpenAI 模型", callback_data="ai_config_models_openai")
+        ],
+        [
+            InlineKeyboardButton(f"{'✅ ' if challenge_pool.provider != 'local' else ''}AI 验证题", callback_data="ai_set_verification_ai"),
+            InlineKeyboardButton(f"{'✅ ' if challenge_pool.provider == 'local' else ''}本地验证题", callback_data="ai_set_verification_local")
+        ],
+        [InlineKeyboardButton("返回主面板", callback_data="panel_back")]
+    ]
+
+    return message, InlineKeyboardMarkup(keyboard)
+
+def _build_status_view():
+    message = (
+        f"📊 **运行状态**\n\n"
+        f"**消息合并**:\n"
+        f"{trust_service.get_report()}\n"
+        f"{media_group_collector.get_report()}\n"
+        f"{burst_coalescer.get_report()}\n\n"
+        f"**更新处理**:\n"
+        f"{update_processor.get_report()}\n\n"
+        f"**话题状态**:\n"
+        f"{topic_health.get_report()}\n"
+        f"{topic_pool.get_report()}\n"
+        f"{message_map.get_report()}\n"
+        f"{pending_queue.get_report()}\n\n"
+        f"**消息发送**:\n"
+        f"{send_scheduler.get_report()}"
+    )
+
+    keyboard = [
+        [InlineKeyboardButton("刷新", callback_data="panel_status")],
+        [InlineKeyboardButton("返回主面板", callback_data="panel_back")]
+    ]
+
+    return message, InlineKeyboardMarkup(keyboard)
+
+async def _edit_challenge_message(query, text: str):
+    if query.message.photo:
+        await query.edit_message_caption(caption=text, reply_markup=None)
+    else:
+        await query.edit_message_text(text=text, reply_markup=None)
+
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -232,97 +339,25 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         success, message, is_banned, new_question = await verify_answer(user_id, answer)
         
         if is_banned:
-            await query.edit_message_text(text=message, reply_markup=None)
+            await _edit_challenge_message(query, message)
             return
         
         if new_question:
-            new_question_text, new_keyboard = new_question
-            await query.edit_message_text(
-                text=f"{message}\n\n{new_question_text}",
-                reply_markup=new_keyboard
-            )
+            new_question_text, new_keyboard, new_image = new_question
+            if new_image or query.message.photo:
+                await send_challenge(query.message, f"{message}\n\n{new_question_text}", new_keyboard, new_image)
+                await query.message.delete()
+            else:
+                await query.edit_message_text(
+                    text=f"{message}\n\n{new_question_text}",
+                    reply_markup=new_keyboard
+                )
             return
         
-        await query.edit_message_text(text=message)
+        await _edit_challenge_message(query, message)
 
         if success:
-            if 'pending_update' in context.user_data:
-                pending_update = context.user_data.pop('pending_update')
-                message = pending_update.message
-                image_bytes = None
-
-                if message.photo:
-                    photo_file = await message.photo[-1].get_file()
-                    image_bytes = await photo_file.download_as_bytearray()
-                elif message.sticker and not message.sticker.is_animated and not message.sticker.is_video:
-                    sticker_file = await message.sticker.get_file()
-                    sticker_bytes = await sticker_file.download_as_bytearray()
-                    image_bytes = await sticker_to_image(sticker_bytes)
-
-                should_forward = True
-                if message.video or message.animation:
-                    pass
-                else:
-                    analyzing_message = await context.bot.send_message(
-                        chat_id=message.chat_id,
-                        text="正在通过AI分析内容是否包含垃圾信息...",
-                        reply_to_message_id=message.message_id
-                    )
-                    analysis_result = await gemini_service.analyze_message(message, image_bytes)
-                    if analysis_result.get("is_spam"):
-                        should_forward = False
-                        media_type = None
-                        media_file_id = None
-                        if message.photo:
-                            media_type = "photo"
-                            media_file_id = message.photo[-1].file_id
-                        elif message.sticker:
-                            media_type = "sticker"
-                            media_file_id = message.sticker.file_id
-
-                        await db.save_filtered_message(
-                            user_id=user_id,
-                            message_id=message.message_id,
-                            content=message.text or message.caption,
-                            reason=analysis_result.get("reason"),
-                            media_type=media_type,
-                            media_file_id=media_file_id,
-                        )
-                        reason = analysis_result.get("reason", "未提供原因")
-                        await analyzing_message.edit_text(f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}")
-                    else:
-                        await analyzing_message.delete()
-
-                if should_forward:
-                    thread_id, is_new = await get_or_create_thread(pending_update, context)
-                    if not thread_id:
-                        await pending_update.message.reply_text("无法创建或找到您的话题，请联系管理员。")
-                        return
-                    
-                    try:
-                        if not is_new:
-                            await _resend_message(pending_update, context, thread_id)
-                    except BadRequest as e:
-                        if "Message thread not found" in e.message:
-                            await db.update_user_thread_id(user_id, None)
-                            await db.update_user_verification(user_id, False)
-                            
-                            context.user_data['pending_update'] = pending_update
-                            question, keyboard = await create_verification(user_id)
-                            
-                            full_message = (
-                                "您的话题已被关闭，请重新进行验证以发送消息。\n\n"
-                                f"{question}"
-                            )
-                            
-                            await pending_update.message.reply_text(
-                                text=full_message,
-                                reply_markup=keyboard
-                            )
-                        else:
-                            print(f"发送消息时发生未知错误: {e}")
-                            await pending_update.message.reply_text("发送消息时发生未知错误，请稍后再试。")
-            else:
+            if not await replay_pending_messages(update, context, user_id):
                 await query.message.reply_text("现在您可以发送消息了！")
     
     elif data == "panel_back":
@@ -349,7 +384,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("黑名单管理", callback_data="panel_blacklist_page_1"), InlineKeyboardButton("所有用户信息", callback_data="panel_stats")],
             [InlineKeyboardButton("被过滤消息", callback_data="panel_filtered_page_1"), InlineKeyboardButton("自动回复管理", callback_data="panel_autoreply")],
             [InlineKeyboardButton("豁免名单管理", callback_data="panel_exemptions_page_1"), InlineKeyboardButton("网络测试管理", callback_data="panel_network_test")],
-            [InlineKeyboardButton("RSS 功能管理", callback_data="panel_rss")],
+            [InlineKeyboardButton("RSS 功能管理", callback_data="panel_rss"), InlineKeyboardButton("AI 模型设置", callback_data="panel_ai_settings")],
+            [InlineKeyboardButton("运行状态", callback_data="panel_status")],
         ]
         
         await query.edit_message_text(
@@ -576,49 +612,9 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await db.is_admin(user_id):
             await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
             return
-            
-        async with db.db_manager.get_connection() as conn:
-             cursor = await conn.execute("""
-                SELECT key, value FROM settings 
-                WHERE key IN (
-                    'ai_provider', 
-                    'gemini_model_filter', 'gemini_model_verification', 'gemini_model_autoreply',
-                    'openai_model_filter', 'openai_model_verification', 'openai_model_autoreply'
-                )
-             """)
-             settings = {row[0]: row[1] for row in await cursor.fetchall()}
-             
-        current_provider = settings.get('ai_provider', 'gemini')
-        
-        provider_name = "Gemini" if current_provider == 'gemini' else "OpenAI"
-        
-        message = (
-            f"🤖 **AI 模型设置**\n\n"
-            f"当前提供商: `{provider_name}`\n\n"
-            f"**Gemini 模型**:\n"
-            f"• 审查: `{settings.get('gemini_model_filter', 'N/A')}`\n"
-            f"• 验证: `{settings.get('gemini_model_verification', 'N/A')}`\n"
-            f"• 回复: `{settings.get('gemini_model_autoreply', 'N/A')}`\n\n"
-            f"**OpenAI 模型**:\n"
-            f"• 审查: `{settings.get('openai_model_filter', 'N/A')}`\n"
-            f"• 验证: `{settings.get('openai_model_verification', 'N/A')}`\n"
-            f"• 回复: `{settings.get('openai_model_autoreply', 'N/A')}`\n\n"
-            f"请选择要配置的项目:"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton(f"{'✅ ' if current_provider == 'gemini' else ''}使用 Gemini", callback_data="ai_set_provider_gemini"),
-                InlineKeyboardButton(f"{'✅ ' if current_provider == 'openai' else ''}使用 OpenAI", callback_data="ai_set_provider_openai")
-            ],
-            [
-                InlineKeyboardButton("配置 Gemini 模型", callback_data="ai_config_models_gemini"),
-                InlineKeyboardButton("配置 OpenAI 模型", callback_data="ai_config_models_openai")
-            ],
-            [InlineKeyboardButton("返回主面板", callback_data="panel_back")]
-        ]
-        
-        await query.edit_message_text(message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+        message, keyboard = await _build_ai_settings_view()
+        await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
 
     elif data.startswith("ai_set_provider_"):
         if not await db.is_admin(user_id): return
@@ -630,46 +626,30 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         await query.answer(f"已切换 AI 提供商为 {new_provider.upper()}")
         
-        async with db.db_manager.get_connection() as conn:
-             cursor = await conn.execute("""
-                SELECT key, value FROM settings 
-                WHERE key IN (
-                    'ai_provider', 
-                    'gemini_model_filter', 'gemini_model_verification', 'gemini_model_autoreply',
-                    'openai_model_filter', 'openai_model_verification', 'openai_model_autoreply'
-                )
-             """)
-             settings = {row[0]: row[1] for row in await cursor.fetchall()}
-             
-        current_provider = settings.get('ai_provider', 'gemini')
-        provider_name = "Gemini" if current_provider == 'gemini' else "OpenAI"
-        
-        message = (
-            f"🤖 **AI 模型设置**\n\n"
-            f"当前提供商: `{provider_name}`\n\n"
-            f"**Gemini 模型**:\n"
-            f"• 审查: `{settings.get('gemini_model_filter', 'N/A')}`\n"
-            f"• 验证: `{settings.get('gemini_model_verification', 'N/A')}`\n"
-            f"• 回复: `{settings.get('gemini_model_autoreply', 'N/A')}`\n\n"
-            f"**OpenAI 模型**:\n"
-            f"• 审查: `{settings.get('openai_model_filter', 'N/A')}`\n"
-            f"• 验证: `{settings.get('openai_model_verification', 'N/A')}`\n"
-            f"• 回复: `{settings.get('openai_model_autoreply', 'N/A')}`\n\n"
-            f"请选择要配置的项目:"
-        )
-        
-        keyboard = [
-            [
-                InlineKeyboardButton(f"{'✅ ' if current_provider == 'gemini' else ''}使用 Gemini", callback_data="ai_set_provider_gemini"),
-                InlineKeyboardButton(f"{'✅ ' if current_provider == 'openai' else ''}使用 OpenAI", callback_data="ai_set_provider_openai")
-            ],
-            [
-                InlineKeyboardButton("配置 Gemini 模型", callback_data="ai_config_models_gemini"),
-                InlineKeyboardButton("配置 OpenAI 模型", callback_data="ai_config_models_openai")
-            ],
-            [InlineKeyboardButton("返回主面板", callback_data="panel_back")]
-        ]
-        await query.edit_message_text(message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        message, keyboard = await _build_ai_settings_view()
+        await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+
+    elif data.startswith("ai_set_verification_"):
+        if not await db.is_admin(user_id): return
+
+        verification_provider = data.split("_")[3]
+        await db.set_setting('verification_provider', verification_provider)
+        challenge_pool.provider = verification_provider
+
+        message, keyboard = await _build_ai_settings_view()
+        await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+
+    elif data == "panel_status":
+        if not await db.is_admin(user_id):
+            await query.answer("抱歉，您没有权限执行此操作。", show_alert=True)
+            return
+
+        message, keyboard = _build_status_view()
+        try:
+            await query.edit_message_text(message, reply_markup=keyboard, parse_mode='Markdown')
+        except BadRequest as e:
+            if "Message is not modified" not in e.message:
+                raise
 
     elif data.startswith("ai_config_models_"):
         if not await db.is_admin(user_id): return
@@ -694,8 +674,6 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         provider_type = parts[3]
         feature_type = parts[4]
         
-        from services.ai_service import ai_service
-        
         await query.answer("正在获取模型列表...", show_alert=False)
         
         try:
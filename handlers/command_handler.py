@@ -38,6 +38,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "- `/blacklist` - 查看黑名单\n"
         "- `/stats` - 查看统计信息\n"
         "- `/view_filtered` - 查看被拦截信息及发送者\n"
+        "- `/notspam <ID>` - 将被拦截消息标记为误判\n"
+        "- `/spam` - 在话题中回复消息，标记为垃圾信息\n"
         "- `/exempt` - 豁免用户内容审查（临时或永久）\n"
     )
     
@@ -155,6 +157,7 @@ async def panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("被过滤消息", callback_data="panel_filtered_page_1"), InlineKeyboardButton("自动回复管理", callback_data="panel_autoreply")],
         [InlineKeyboardButton("豁免名单管理", callback_data="panel_exemptions_page_1"), InlineKeyboardButton("网络测试管理", callback_data="panel_network_test")],
         [InlineKeyboardButton("RSS 功能管理", callback_data="panel_rss"), InlineKeyboardButton("AI 模型设置", callback_data="panel_ai_settings")],
+        [InlineKeyboardButton("运行状态", callback_data="panel_status")],
     ]
     
     await update.message.reply_text(
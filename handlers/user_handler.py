@@ -1,31 +1,493 @@
-from telegram import Update, constants
+import asyncio
+import time
+from telegram import Update, ReplyParameters, constants
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from database import models as db
-from services.verification import create_verification, is_verification_pending, get_pending_verification_message
+from services.verification import create_verification, is_verification_pending, get_pending_verification_message, send_challenge
 from services.thread_manager import get_or_create_thread
 from services.gemini_service import gemini_service
-from utils.media_converter import sticker_to_image
-from utils.message_sender import send_message_by_type
+from services.ai_service import is_autoreply_refusal, AUTOREPLY_REFUSAL_WINDOW
+from services.media_processor import media_processor
+from services.media_group import media_group_collector
+from services.burst_coalescer import burst_coalescer, merge_text_messages
+from services.topic_health import topic_health
+from services.pending_queue import pending_queue
+from utils.message_sender import relay_message, relay_messages, relay_message_ids, sync_edit
+from services.message_map import message_map
+from services.trust import trust_service
 from services.rate_limiter import rate_limiter
+from services.knowledge_index import knowledge_index
+from services.autoreply_cache import autoreply_cache
 from config import config
 
-async def handle_invalid_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+STREAM_EDIT_INTERVAL = 1.5
+MAX_MESSAGE_LENGTH = 4096
+MODERATION_STATUS_TEXT = "正在通过AI分析内容是否包含垃圾信息..."
+STREAM_INTERRUPTED_NOTE = "\n\n（回复中断，请等待管理员回复）"
+
+async def handle_invalid_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int, thread_id: int = None):
+    if thread_id:
+        topic_health.forget(thread_id)
     await db.update_user_thread_id(user_id, None)
     await db.update_user_verification(user_id, False)
-    context.user_data['pending_update'] = update
-    question, keyboard = await create_verification(user_id)
+    await _queue_pending(update)
+    question, keyboard, image = await create_verification(user_id)
     full_message = (
         "您的话题已被关闭，请重新进行验证以发送消息。\n\n"
         f"{question}"
     )
-    await update.message.reply_text(
-        text=full_message,
-        reply_markup=keyboard
-    )
+    await send_challenge(update.effective_message, full_message, keyboard, image)
+
+async def _queue_pending(update: Update):
+    message = update.message
+    if not message:
+        return
+    max_side, _ = await gemini_service.get_image_profile()
+    pending_queue.add(update.effective_user.id, message, media_processor.describe_source(message, max_side))
 
 async def _resend_message(update: Update, context: ContextTypes.DEFAULT_TYPE, thread_id: int):
-    return await send_message_by_type(context.bot, update.message, config.FORUM_GROUP_ID, thread_id, True)
+    message = update.message
+    user_id = update.effective_user.id
+    reply_to_message_id = None
+    if message.reply_to_message:
+        mapped = await message_map.get_forum_message(user_id, message.reply_to_message.message_id)
+        if mapped and mapped[1] == thread_id:
+            reply_to_message_id = mapped[0]
+
+    sent_msg = await relay_message(context.bot, message, config.FORUM_GROUP_ID, thread_id, True, reply_to_message_id)
+    if sent_msg:
+        await message_map.record(user_id, message.message_id, sent_msg.message_id, thread_id)
+    return sent_msg
+
+async def handle_edited_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.edited_message
+    user = update.effective_user
+    await media_group_collector.wait(user.id)
+    await burst_coalescer.wait(user.id)
+    mapped = await message_map.get_forum_message(user.id, message.message_id)
+    is_merged = burst_coalescer.has_post(user.id, message.message_id)
+    if not mapped and not is_merged:
+        return
+
+    is_blocked, _ = await db.is_blacklisted(user.id)
+    if is_blocked:
+        return
+
+    if message.text and not await db.is_exempted(user.id):
+        analysis_result = await gemini_service.analyze_message(message)
+        if analysis_result.get("is_spam"):
+            reason = analysis_result.get("reason", "未提供原因")
+            await message.reply_text(f"您编辑后的消息已被系统拦截，管理员看到的仍是原消息\n\n原因：{reason}")
+            return
+
+    try:
+        if is_merged:
+            forum_message_id, text, entities = burst_coalescer.edit_post(user.id, message)
+            await context.bot.edit_message_text(
+                chat_id=config.FORUM_GROUP_ID,
+                message_id=forum_message_id,
+                text=text,
+                entities=entities
+            )
+        else:
+            forum_message_id, _ = mapped
+            await sync_edit(context.bot, message, config.FORUM_GROUP_ID, forum_message_id)
+    except BadRequest as e:
+        print(f"同步用户编辑失败: {e}")
+
+async def _send_autoreply(update: Update, autoreply_text: str):
+    try:
+        await update.message.reply_text(
+            autoreply_text,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        print(f"Markdown解析失败，使用纯文本: {e}")
+        await update.message.reply_text(autoreply_text)
+
+async def _stream_autoreply(update: Update, question: str, knowledge_base_content: str) -> tuple:
+    chunks = []
+    sent_msg = None
+    shown_text = ""
+    last_edit = 0.0
+    try:
+        async for chunk in gemini_service.stream_autoreply(question, knowledge_base_content):
+            chunks.append(chunk)
+            current_text = "".join(chunks).strip()
+            if sent_msg is None:
+                if len(current_text) < AUTOREPLY_REFUSAL_WINDOW or is_autoreply_refusal(current_text):
+                    continue
+                sent_msg = await update.message.reply_text(current_text[:MAX_MESSAGE_LENGTH])
+                shown_text, last_edit = current_text, time.monotonic()
+            elif time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL and current_text != shown_text:
+                try:
+                    await sent_msg.edit_text(current_text[:MAX_MESSAGE_LENGTH])
+                    shown_text = current_text
+                except Exception as e:
+                    print(f"流式更新自动回复失败: {e}")
+                last_edit = time.monotonic()
+    except Exception as e:
+        print(f"流式生成自动回复失败: {e}")
+        if sent_msg is None:
+            return None, False
+        interrupted_text = "".join(chunks).strip()[:MAX_MESSAGE_LENGTH - len(STREAM_INTERRUPTED_NOTE)] + STREAM_INTERRUPTED_NOTE
+        try:
+            await sent_msg.edit_text(interrupted_text)
+        except Exception as e2:
+            print(f"更新自动回复失败: {e2}")
+        return interrupted_text, False
+
+    final_text = "".join(chunks).strip()
+    if sent_msg is None:
+        if not final_text or is_autoreply_refusal(final_text):
+            return None, True
+        await _send_autoreply(update, final_text)
+        return final_text, True
+
+    try:
+        await sent_msg.edit_text(final_text, parse_mode='Markdown')
+    except Exception as e:
+        print(f"Markdown解析失败，使用纯文本: {e}")
+        if final_text != shown_text:
+            try:
+                await sent_msg.edit_text(final_text)
+            except Exception as e2:
+                print(f"更新自动回复失败: {e2}")
+    return final_text, True
+
+async def _notify_admin_autoreply(context: ContextTypes.DEFAULT_TYPE, thread_id: int, forwarded_message_id: int, autoreply_text: str, is_cached: bool):
+    title = "自动回复内容（缓存）" if is_cached else "自动回复内容"
+    admin_notification = (
+        f"{title}:\n\n"
+        f"{autoreply_text}"
+    )
+    try:
+        await context.bot.send_message(
+            chat_id=config.FORUM_GROUP_ID,
+            text=admin_notification,
+            message_thread_id=thread_id,
+            reply_to_message_id=forwarded_message_id,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        print(f"发送自动回复通知给管理员失败（Markdown），尝试纯文本: {e}")
+        try:
+            await context.bot.send_message(
+                chat_id=config.FORUM_GROUP_ID,
+                text=admin_notification,
+                message_thread_id=thread_id,
+                reply_to_message_id=forwarded_message_id
+            )
+        except Exception as e2:
+            print(f"发送自动回复通知给管理员失败: {e2}")
+
+async def _moderate_with_status(context: ContextTypes.DEFAULT_TYPE, message, analyze, blocked_text: str = "您的消息已被系统拦截，因此未被转发") -> dict:
+    settings = await db.get_settings(['moderation_status_mode', 'moderation_status_budget_ms'])
+    status_message = None
+    if settings.get('moderation_status_mode', 'action') == 'message':
+        status_message = await message.reply_text(MODERATION_STATUS_TEXT, do_quote=True)
+        analysis_result = await analyze()
+    else:
+        await context.bot.send_chat_action(chat_id=message.chat_id, action=constants.ChatAction.TYPING)
+        analysis_task = asyncio.ensure_future(analyze())
+        budget = int(settings.get('moderation_status_budget_ms', 1500)) / 1000
+        done, _ = await asyncio.wait({analysis_task}, timeout=budget)
+        if not done:
+            status_message = await message.reply_text(MODERATION_STATUS_TEXT, do_quote=True)
+        analysis_result = await analysis_task
+
+    if analysis_result.get("is_spam"):
+        reason = analysis_result.get("reason", "未提供原因")
+        blocked_message = f"{blocked_text}\n\n原因：{reason}"
+        if status_message:
+            await status_message.edit_text(blocked_message)
+        else:
+            await message.reply_text(blocked_message, do_quote=True)
+    elif status_message:
+        await status_message.delete()
+    return analysis_result
+
+async def _save_filtered(user_id: int, message, analysis_result: dict):
+    await db.save_filtered_message(
+        user_id=user_id,
+        message_id=message.message_id,
+        content=message.text or message.caption,
+        reason=analysis_result.get("reason"),
+        verdict_source=analysis_result.get("source"),
+        media_type=message.photo and "photo" or message.sticker and "sticker" or message.video and "video" or message.animation and "animation",
+        media_file_id=message.photo and message.photo[-1].file_id or message.sticker and message.sticker.file_id or message.video and message.video.file_id or message.animation and message.animation.file_id,
+    )
+
+async def _retroactive_moderation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    message = update.message
+    user = update.effective_user
+    try:
+        max_side, byte_budget = await gemini_service.get_image_profile()
+        image_bytes, image_hash = await media_processor.load_image_for_analysis(message, max_side, byte_budget)
+        if not message.text and not image_bytes:
+            return
+
+        analysis_result = await gemini_service.analyze_message(message, image_bytes, image_hash)
+        await trust_service.record_verdict(user.id, analysis_result, retroactive=True)
+        if not analysis_result.get("is_spam"):
+            if message.text:
+                await db.set_message_verdict_source(user.id, message.message_id, analysis_result.get("source"))
+            return
+
+        mapped = await message_map.get_forum_message(user.id, message.message_id)
+        if mapped:
+            await context.bot.delete_message(chat_id=config.FORUM_GROUP_ID, message_id=mapped[0])
+        await db.delete_incoming_message(user.id, message.message_id)
+        await _save_filtered(user.id, message, analysis_result)
+        reason = analysis_result.get("reason", "未提供原因")
+        await message.reply_text(f"您的消息已被系统拦截，已从管理员处撤回\n\n原因：{reason}")
+    except Exception as e:
+        print(f"事后审查消息失败: {e}")
+
+async def _moderate_pending(context: ContextTypes.DEFAULT_TYPE, user_id: int, entries: list) -> list:
+    if await db.is_exempted(user_id):
+        for entry in entries:
+            entry['verdict_source'] = 'exempt'
+        return entries
+
+    max_side, byte_budget = await gemini_service.get_image_profile()
+
+    async def analyze(entry):
+        image_bytes = image_hash = None
+        if entry['image_file_id']:
+            try:
+                image_bytes, image_hash = await media_processor.load_file_for_analysis(
+                    context.bot, entry['image_file_id'], entry['image_kind'], max_side, byte_budget
+                )
+            except Exception as e:
+                print(f"下载暂存消息图片失败: {e}")
+        if not entry['text'] and not image_bytes:
+            return None
+        return await gemini_service.analyze_content(entry['text'], image_bytes, image_hash)
+
+    await context.bot.send_chat_action(chat_id=entries[0]['chat_id'], action=constants.ChatAction.TYPING)
+    results = await asyncio.gather(*(analyze(entry) for entry in entries))
+    clean = []
+    for entry, analysis_result in zip(entries, results):
+        if not analysis_result:
+            clean.append(entry)
+            continue
+        await trust_service.record_verdict(user_id, analysis_result)
+        entry['verdict_source'] = analysis_result.get("source")
+        if not analysis_result.get("is_spam"):
+            clean.append(entry)
+            continue
+        reason = analysis_result.get("reason", "未提供原因")
+        await db.save_filtered_message(
+            user_id=user_id,
+            message_id=entry['message_id'],
+            content=entry['text'] or entry['caption'],
+            reason=reason,
+            media_type=entry['media_type'],
+            media_file_id=entry['media_file_id'],
+            verdict_source=analysis_result.get("source"),
+        )
+        await context.bot.send_message(
+            chat_id=entry['chat_id'],
+            text=f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}",
+            reply_parameters=ReplyParameters(message_id=entry['message_id'], allow_sending_without_reply=True)
+        )
+    return clean
+
+async def replay_pending_messages(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    entries = pending_queue.take(user_id)
+    if not entries:
+        return False
+
+    clean = await _moderate_pending(context, user_id, entries)
+    if not clean:
+        return True
+
+    thread_id, is_new = await get_or_create_thread(update, context, resend=False)
+    if not thread_id:
+        await update.effective_message.reply_text("无法创建或找到您的话题，请联系管理员。")
+        return True
+
+    if not is_new and not topic_health.is_alive(thread_id):
+        pending_queue.requeue(user_id, clean)
+        await handle_invalid_thread(update, context, user_id, thread_id)
+        return True
+
+    try:
+        copied = await relay_message_ids(
+            context.bot,
+            clean[0]['chat_id'],
+            [entry['message_id'] for entry in clean],
+            config.FORUM_GROUP_ID,
+            thread_id
+        )
+        topic_health.record_success(thread_id)
+    except BadRequest as e:
+        if "Message thread not found" in e.message:
+            topic_health.mark_dead(thread_id, 'send_failures')
+            pending_queue.requeue(user_id, clean)
+            await handle_invalid_thread(update, context, user_id, thread_id)
+        else:
+            print(f"发送消息时发生未知错误: {e}")
+            await update.effective_message.reply_text("发送消息时发生未知错误，请稍后再试。")
+        return True
+
+    for source_id, copied_id in copied.items():
+        await message_map.record(user_id, source_id, copied_id, thread_id)
+    for entry in clean:
+        if entry['text'] and entry['message_id'] in copied:
+            await db.save_message(user_id, entry['message_id'], entry['text'], 'incoming', verdict_source=entry.get('verdict_source'))
+    return True
+
+async def _load_media_group_images(messages: list) -> list:
+    max_side, byte_budget = await gemini_service.get_image_profile()
+    loaded = await asyncio.gather(
+        *[media_processor.load_image_for_analysis(message, max_side, byte_budget) for message in messages],
+        return_exceptions=True
+    )
+    images = []
+    for result in loaded:
+        if isinstance(result, Exception):
+            print(f"下载相册图片失败: {result}")
+        elif result[0]:
+            images.append(result)
+    return images
+
+async def _handle_media_group(updates: list, context: ContextTypes.DEFAULT_TYPE):
+    first_update = updates[0]
+    user = first_update.effective_user
+    messages = [update.message for update in updates]
+
+    images = await _load_media_group_images(messages)
+    if images and not await db.is_exempted(user.id):
+        analysis_result = await _moderate_with_status(
+            context,
+            messages[0],
+            lambda: gemini_service.analyze_media_group("", images),
+            "您的相册已被系统拦截，因此未被转发"
+        )
+        if analysis_result.get("is_spam"):
+            for message in messages:
+                await db.save_filtered_message(
+                    user_id=user.id,
+                    message_id=message.message_id,
+                    content=message.caption,
+                    reason=analysis_result.get("reason"),
+                    media_type=message.photo and "photo" or message.video and "video",
+                    media_file_id=message.photo and message.photo[-1].file_id or message.video and message.video.file_id,
+                    verdict_source=analysis_result.get("source"),
+                )
+            return
+
+    thread_id, is_new = await get_or_create_thread(first_update, context, resend=False)
+    if not thread_id:
+        await first_update.message.reply_text("无法创建或找到您的话题，请联系管理员。")
+        return
+
+    if not topic_health.is_alive(thread_id):
+        await handle_invalid_thread(first_update, context, user.id, thread_id)
+        return
+
+    try:
+        copied = await relay_messages(context.bot, messages, config.FORUM_GROUP_ID, thread_id)
+        for user_message_id, forum_message_id in copied.items():
+            await message_map.record(user.id, user_message_id, forum_message_id, thread_id)
+        topic_health.record_success(thread_id)
+    except BadRequest as e:
+        if "thread not found" in e.message.lower() or "topic not found" in e.message.lower():
+            topic_health.mark_dead(thread_id, 'send_failures')
+            await handle_invalid_thread(first_update, context, user.id, thread_id)
+            return
+        print(f"发送相册时发生未知错误: {e}")
+        await first_update.message.reply_text("发送消息时发生未知错误，请稍后再试。")
+
+async def _retroactive_burst(context: ContextTypes.DEFAULT_TYPE, user_id: int, messages: list, text: str, forum_message_id: int):
+    try:
+        analysis_result = await gemini_service.analyze_content(text)
+        await trust_service.record_verdict(user_id, analysis_result, retroactive=True)
+        if not analysis_result.get("is_spam"):
+            for message in messages:
+                await db.set_message_verdict_source(user_id, message.message_id, analysis_result.get("source"))
+            return
+
+        await context.bot.delete_message(chat_id=config.FORUM_GROUP_ID, message_id=forum_message_id)
+        for message in messages:
+            await db.delete_incoming_message(user_id, message.message_id)
+            await _save_filtered(user_id, message, analysis_result)
+        reason = analysis_result.get("reason", "未提供原因")
+        await messages[-1].reply_text(f"您连续发送的消息已被系统拦截，已从管理员处撤回\n\n原因：{reason}")
+    except Exception as e:
+        print(f"事后审查连续消息失败: {e}")
+
+async def _handle_text_burst(updates: list, context: ContextTypes.DEFAULT_TYPE):
+    user = updates[0].effective_user
+    user_data = await db.get_user(user.id)
+    if len(updates) == 1:
+        await _process_message(updates[0], context, user_data)
+        return
+
+    messages = [update.message for update in updates]
+    parts = [[message.message_id, message.text, message.entities] for message in messages]
+    text, entities = merge_text_messages([(part[1], part[2]) for part in parts])
+
+    is_exempted = await db.is_exempted(user.id)
+    is_trusted = not is_exempted and await trust_service.is_trusted(user_data)
+    verdict_source = 'exempt' if is_exempted else None
+    if not is_exempted and not is_trusted:
+        analysis_result = await _moderate_with_status(
+            context,
+            messages[-1],
+            lambda: gemini_service.analyze_content(text),
+            "您连续发送的消息已被系统拦截，因此未被转发"
+        )
+        await trust_service.record_verdict(user.id, analysis_result)
+        verdict_source = analysis_result.get("source")
+        if analysis_result.get("is_spam"):
+            for message in messages:
+                await _save_filtered(user.id, message, analysis_result)
+            return
+
+    thread_id, is_new = await get_or_create_thread(updates[0], context, resend=False)
+    if not thread_id:
+        await messages[-1].reply_text("无法创建或找到您的话题，请联系管理员。")
+        return
+
+    if not is_new and not topic_health.is_alive(thread_id):
+        for update in updates[:-1]:
+            await _queue_pending(update)
+        await handle_invalid_thread(updates[-1], context, user.id, thread_id)
+        return
+
+    try:
+        sent_msg = await context.bot.send_message(
+            chat_id=config.FORUM_GROUP_ID,
+            text=text,
+            entities=entities,
+            message_thread_id=thread_id,
+            disable_web_page_preview=True
+        )
+        topic_health.record_success(thread_id)
+    except BadRequest as e:
+        if "thread not found" in e.message.lower() or "topic not found" in e.message.lower():
+            topic_health.mark_dead(thread_id, 'send_failures')
+            for update in updates[:-1]:
+                await _queue_pending(update)
+            await handle_invalid_thread(updates[-1], context, user.id, thread_id)
+        else:
+            print(f"发送消息时发生未知错误: {e}")
+            await messages[-1].reply_text("发送消息时发生未知错误，请稍后再试。")
+        return
+
+    await message_map.record(user.id, messages[-1].message_id, sent_msg.message_id, thread_id)
+    burst_coalescer.remember_post(user.id, parts, sent_msg.message_id)
+    for message in messages:
+        await db.save_message(user.id, message.message_id, message.text, 'incoming', verdict_source=verdict_source)
+
+    if is_trusted:
+        context.application.create_task(_retroactive_burst(context, user.id, messages, text, sent_msg.message_id))
+
+    await _autoreply(updates[-1], context, text, thread_id, sent_msg.message_id)
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     from network_test.handlers import handle_message as network_handle_message
@@ -60,10 +522,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
     
-    if 'pending_update' in context.user_data:
-        if context.user_data['pending_update'].update_id == update.update_id:
-            context.user_data.pop('pending_update')
-    
     is_blocked, is_permanent = await db.is_blacklisted(user.id)
     if is_blocked:
         if is_permanent:
@@ -110,58 +568,59 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if has_pending and not is_expired:
                 verification_data = get_pending_verification_message(user.id)
                 if verification_data:
-                    question, keyboard = verification_data
-                    context.user_data['pending_update'] = update
-                    await update.message.reply_text(
+                    question, keyboard, image = verification_data
+                    await _queue_pending(update)
+                    await send_challenge(
+                        update.message,
                         "您还有未完成的人机验证，请先完成验证后再发送消息。\n\n"
                         f"请完成人机验证: \n\n{question}",
-                        reply_markup=keyboard
+                        keyboard,
+                        image
                     )
                     return
             else:
-                context.user_data['pending_update'] = update
-                question, keyboard = await create_verification(user.id)
-                await update.message.reply_text(question, reply_markup=keyboard)
+                await _queue_pending(update)
+                question, keyboard, image = await create_verification(user.id)
+                await send_challenge(update.message, question, keyboard, image)
                 return
     
     message = update.message
-    image_bytes = None
-
-    if message.photo:
-        photo_file = await message.photo[-1].get_file()
-        image_bytes = await photo_file.download_as_bytearray()
-    elif message.sticker and not message.sticker.is_animated and not message.sticker.is_video:
-        sticker_file = await message.sticker.get_file()
-        sticker_bytes = await sticker_file.download_as_bytearray()
-        image_bytes = await sticker_to_image(sticker_bytes)
-
-    if message.video or message.animation:
-        pass
-    else:
-        is_exempted = await db.is_exempted(user.id)
-        
-        if not is_exempted:
-            analyzing_message = await context.bot.send_message(
-                chat_id=message.chat_id,
-                text="正在通过AI分析内容是否包含垃圾信息...",
-                reply_to_message_id=message.message_id
-            )
+    if not message.media_group_id:
+        await media_group_collector.wait(user.id)
 
-            analysis_result = await gemini_service.analyze_message(message, image_bytes)
+    if message.text and not message.reply_to_message:
+        if await burst_coalescer.add(update, context, _handle_text_burst):
+            return
+    await burst_coalescer.wait(user.id)
+
+    if message.media_group_id:
+        await media_group_collector.add(update, context, _handle_media_group)
+        return
+
+    await _process_message(update, context, user_data)
+
+async def _process_message(update: Update, context: ContextTypes.DEFAULT_TYPE, user_data: dict):
+    user = update.effective_user
+    message = update.message
+    is_exempted = await db.is_exempted(user.id)
+    is_trusted = not is_exempted and await trust_service.is_trusted(user_data)
+    verdict_source = 'exempt' if is_exempted else None
+
+    if not is_exempted and not is_trusted:
+        max_side, byte_budget = await gemini_service.get_image_profile()
+        image_bytes, image_hash = await media_processor.load_image_for_analysis(message, max_side, byte_budget)
+
+        if message.text or image_bytes:
+            analysis_result = await _moderate_with_status(
+                context,
+                message,
+                lambda: gemini_service.analyze_message(message, image_bytes, image_hash)
+            )
+            await trust_service.record_verdict(user.id, analysis_result)
+            verdict_source = analysis_result.get("source")
             if analysis_result.get("is_spam"):
-                await db.save_filtered_message(
-                    user_id=user.id,
-                    message_id=message.message_id,
-                    content=message.text or message.caption,
-                    reason=analysis_result.get("reason"),
-                    media_type=message.photo and "photo" or message.sticker and "sticker",
-                    media_file_id=message.photo and message.photo[-1].file_id or message.sticker and message.sticker.file_id,
-                )
-                reason = analysis_result.get("reason", "未提供原因")
-                await analyzing_message.edit_text(f"您的消息已被系统拦截，因此未被转发\n\n原因：{reason}")
+                await _save_filtered(user.id, message, analysis_result)
                 return
-            else:
-                await analyzing_message.delete()
 
     thread_id, is_new = await get_or_create_thread(update, context)
     if not thread_id:
@@ -170,96 +629,69 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     forwarded_message_id = None
     if is_new:
+        if message.text:
+            await db.save_message(user.id, message.message_id, message.text, 'incoming', verdict_source=verdict_source)
+        if is_trusted:
+            context.application.create_task(_retroactive_moderation(update, context))
         return
     
-    try:
-        probe_msg = await context.bot.forward_message(
-            chat_id=config.FORUM_GROUP_ID,
-            from_chat_id=config.FORUM_GROUP_ID,
-            message_id=thread_id,
-            message_thread_id=thread_id,
-            disable_notification=True
-        )
-        await context.bot.delete_message(
-            chat_id=config.FORUM_GROUP_ID,
-            message_id=probe_msg.message_id
-        )
-    except BadRequest as e:
-        error_text = e.message.lower()
-        if "message to forward not found" in error_text or \
-           "message not found" in error_text or \
-           "thread not found" in error_text or \
-           "topic not found" in error_text:
-            await handle_invalid_thread(update, context, user.id)
-            return
-        print(f"Topic probe failed with unexpected error: {e}")
+    if not topic_health.is_alive(thread_id):
+        await handle_invalid_thread(update, context, user.id, thread_id)
+        return
     
     try:
         sent_msg = None
         if message.text:
-            sent_msg = await context.bot.send_message(
-                chat_id=config.FORUM_GROUP_ID,
-                text=message.text,
-                entities=message.entities,
-                message_thread_id=thread_id,
-                disable_web_page_preview=True
-            )
+            sent_msg = await _resend_message(update, context, thread_id)
             forwarded_message_id = sent_msg.message_id
+            topic_health.record_success(thread_id)
+            await db.save_message(user.id, message.message_id, message.text, 'incoming', verdict_source=verdict_source)
         else:
             await _resend_message(update, context, thread_id)
+            topic_health.record_success(thread_id)
+            if is_trusted:
+                context.application.create_task(_retroactive_moderation(update, context))
             return
     except BadRequest as e:
         if "thread not found" in e.message.lower() or "topic not found" in e.message.lower():
-            await handle_invalid_thread(update, context, user.id)
+            topic_health.mark_dead(thread_id, 'send_failures')
+            await handle_invalid_thread(update, context, user.id, thread_id)
             return
         else:
             print(f"发送消息时发生未知错误: {e}")
             await update.message.reply_text("发送消息时发生未知错误，请稍后再试。")
             return
     
-    if message.text and await db.get_autoreply_enabled():
-        knowledge_base_content = await db.get_all_knowledge_content()
+    if is_trusted:
+        context.application.create_task(_retroactive_moderation(update, context))
+
+    if message.text:
+        await _autoreply(update, context, message.text, thread_id, forwarded_message_id)
+
+async def _autoreply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, thread_id: int, forwarded_message_id: int):
+    if not await db.get_autoreply_enabled():
+        return
+
+    knowledge_base_version = await db.get_knowledge_base_version()
+    autoreply_text = autoreply_cache.lookup(text, knowledge_base_version)
+    is_cached = autoreply_text is not None
+    if is_cached:
+        await _send_autoreply(update, autoreply_text)
+    else:
+        knowledge_base_content = await knowledge_index.build_context(text)
         if knowledge_base_content:
-            autoreply_text = await gemini_service.generate_autoreply(
-                message.text,
-                knowledge_base_content
-            )
-            
-            if autoreply_text:
-                try:
-                    await update.message.reply_text(
-                        autoreply_text,
-                        parse_mode='Markdown'
-                    )
-                except Exception as e:
-                    print(f"Markdown解析失败，使用纯文本: {e}")
-                    await update.message.reply_text(autoreply_text)
-                
-                if forwarded_message_id:
-                    admin_notification = (
-                        f"自动回复内容:\n\n"
-                        f"{autoreply_text}"
-                    )
-                    try:
-                        await context.bot.send_message(
-                            chat_id=config.FORUM_GROUP_ID,
-                            text=admin_notification,
-                            message_thread_id=thread_id,
-                            reply_to_message_id=forwarded_message_id,
-                            parse_mode='Markdown'
-                        )
-                    except Exception as e:
-                        print(f"发送自动回复通知给管理员失败（Markdown），尝试纯文本: {e}")
-                        try:
-                            admin_notification_plain = (
-                                f"自动回复内容:\n\n"
-                                f"{autoreply_text}"
-                            )
-                            await context.bot.send_message(
-                                chat_id=config.FORUM_GROUP_ID,
-                                text=admin_notification_plain,
-                                message_thread_id=thread_id,
-                                reply_to_message_id=forwarded_message_id
-                            )
-                        except Exception as e2:
-                            print(f"发送自动回复通知给管理员失败: {e2}")
+            is_complete = True
+            if await db.get_setting('autoreply_streaming', '1') == '1':
+                autoreply_text, is_complete = await _stream_autoreply(update, text, knowledge_base_content)
+            else:
+                autoreply_text = await gemini_service.generate_autoreply(
+                    text,
+                    knowledge_base_content
+                )
+                if autoreply_text:
+                    await _send_autoreply(update, autoreply_text)
+            if is_complete:
+                autoreply_cache.store(text, knowledge_base_version, autoreply_text)
+
+    if autoreply_text and forwarded_message_id:
+        await _notify_admin_autoreply(context, thread_id, forwarded_message_id, autoreply_text, is_cached)
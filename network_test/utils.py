@@ -1,6 +1,7 @@
 import asyncio
 import time
 import logging
+from services.send_scheduler import PRIORITY_BACKGROUND
 
 def check_authorization(user_id: int, authorized_users: list, admin_users: list = None) -> bool:
     if admin_users and user_id in admin_users:
@@ -28,7 +29,8 @@ async def progress_spinner(context, chat_id: int, message_id: int, base_text: st
                 chat_id=chat_id,
                 message_id=message_id,
                 text=f"{base_text}{spinner}",
-                parse_mode="HTML"
+                parse_mode="HTML",
+                rate_limit_args={"priority": PRIORITY_BACKGROUND}
             )
         except Exception as e:
             logging.error(f"更新进度消息失败: {e}")
@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from config import config
+from database import models as db
+
+PRIORITY_VERIFICATION = 0
+PRIORITY_MODERATION = 1
+PRIORITY_AUTOREPLY = 2
+PRIORITY_BACKGROUND = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_VERIFICATION: "验证",
+    PRIORITY_MODERATION: "审查",
+    PRIORITY_AUTOREPLY: "回复",
+    PRIORITY_BACKGROUND: "后台",
+}
+
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_CALL_TIMEOUT = 30
+SETTINGS_REFRESH_INTERVAL = 60
+
+
+_queue_wait = contextvars.ContextVar('ai_queue_wait', default=None)
+
+
+class AISchedulerError(Exception):
+    pass
+
+
+def track_queue_wait() -> list:
+    holder = [0.0]
+    _queue_wait.set(holder)
+    return holder
+
+
+def current_queue_wait() -> list:
+    return _queue_wait.get()
+
+
+class AIScheduler:
+    def __init__(self, max_concurrency: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.max_queue_size = DEFAULT_QUEUE_SIZE
+        self.call_timeout = DEFAULT_CALL_TIMEOUT
+        self.active = 0
+        self.waiting = []
+        self.counter = itertools.count()
+        self.stats = {
+            priority: {'completed': 0, 'timed_out': 0, 'rejected': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    async def acquire(self, priority: int):
+        stats = self.stats[priority]
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            return
+
+        if len(self.waiting) >= self.max_queue_size:
+            stats['rejected'] += 1
+            raise AISchedulerError("AI 请求队列已满")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self.counter), future)
+        heapq.heappush(self.waiting, entry)
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            stats['timed_out'] += 1
+            raise AISchedulerError(f"AI 请求排队超过 {self.queue_timeout} 秒") from None
+
+        waited = time.monotonic() - started
+        holder = _queue_wait.get()
+        if holder is not None:
+            holder[0] += waited
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+
+    def release(self):
+        while self.waiting:
+            _, _, future = heapq.heappop(self.waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.stats[priority]['completed'] += 1
+            self.release()
+
+    async def run(self, priority: int, factory):
+        async with self.slot(priority):
+            try:
+                return await asyncio.wait_for(factory(), self.call_timeout)
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(f"AI 调用超过 {self.call_timeout:g} 秒未响应") from None
+
+    def get_report(self) -> str:
+        lines = [
+            f"并发: {self.active}/{self.max_concurrency}, 排队: {len(self.waiting)}/{self.max_queue_size}, "
+            f"排队超时: {self.queue_timeout} 秒, 调用超时: {self.call_timeout:g} 秒"
+        ]
+        for priority, name in PRIORITY_NAMES.items():
+            stats = self.stats[priority]
+            queued = sum(1 for entry in self.waiting if entry[0] == priority)
+            average = stats['wait_total'] / stats['completed'] * 1000 if stats['completed'] else 0
+            lines.append(
+                f"• {name}: 完成 {stats['completed']}, 排队 {queued}, 超时 {stats['timed_out']}, "
+                f"拒绝 {stats['rejected']}, 平均等待 {average:.0f}ms, 最长 {stats['wait_max'] * 1000:.0f}ms"
+            )
+        return "\n".join(lines)
+
+
+async def _refresh_settings_job(context):
+    try:
+        settings = await db.get_settings(['queue_max_size', 'ai_call_timeout'])
+        ai_scheduler.max_queue_size = int(settings.get('queue_max_size', DEFAULT_QUEUE_SIZE))
+        ai_scheduler.call_timeout = float(settings.get('ai_call_timeout', DEFAULT_CALL_TIMEOUT))
+    except Exception as e:
+        print(f"读取AI队列设置失败: {e}")
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _refresh_settings_job,
+        interval=SETTINGS_REFRESH_INTERVAL,
+        first=0,
+        name="ai_scheduler_settings",
+    )
+
+
+ai_scheduler = AIScheduler(config.MAX_WORKERS, config.QUEUE_TIMEOUT)
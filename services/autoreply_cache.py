@@ -0,0 +1,130 @@
+import random
+import re
+import zlib
+from collections import OrderedDict
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 32
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SIMILARITY_THRESHOLD = 0.55
+MAX_ENTRIES = 500
+SHINGLE_SIZE = 2
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+_NOISE = re.compile(r'[\s\W_]+')
+_FILLER_PREFIX = re.compile(r'^(?:你好|您好|请问|请教一下|问一下|想问一下|麻烦问一下|我想问)+')
+_FILLER_SUFFIX = re.compile(r'(?:呢|吗|嘛|呀|啊|吧|哈)+$')
+
+
+def normalize_question(question: str) -> str:
+    text = _NOISE.sub('', question or '').casefold()
+    stripped = _FILLER_SUFFIX.sub('', _FILLER_PREFIX.sub('', text))
+    return stripped or text
+
+
+def shingles(question: str) -> frozenset:
+    text = normalize_question(question)
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+
+def minhash(shingle_set: frozenset) -> tuple:
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingle_set]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def _bands(signature: tuple) -> list:
+    return [(band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]) for band in range(LSH_BANDS)]
+
+
+class AutoreplyCache:
+    def __init__(self):
+        self.version = None
+        self.entries = OrderedDict()
+        self.buckets = {}
+        self.stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _reset(self, version: int):
+        if self.entries:
+            self.stats['invalidations'] += 1
+        self.version = version
+        self.entries.clear()
+        self.buckets.clear()
+
+    def _evict(self, key: frozenset):
+        entry = self.entries.pop(key)
+        for band in _bands(entry['signature']):
+            bucket = self.buckets.get(band)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band]
+
+    def lookup(self, question: str, version: int) -> str:
+        if version != self.version:
+            self._reset(version)
+
+        key = shingles(question)
+        if not key:
+            return None
+
+        best, best_score = None, 0.0
+        if key in self.entries:
+            best, best_score = key, 1.0
+        else:
+            candidates = set()
+            for band in _bands(minhash(key)):
+                candidates.update(self.buckets.get(band, ()))
+            for candidate in candidates:
+                score = len(key & candidate) / len(key | candidate)
+                if score > best_score:
+                    best, best_score = candidate, score
+
+        if best is None or best_score < SIMILARITY_THRESHOLD:
+            self.stats['misses'] += 1
+            return None
+
+        self.entries.move_to_end(best)
+        self.stats['hits'] += 1
+        if best != key:
+            self.stats['near_hits'] += 1
+        return self.entries[best]['answer']
+
+    def store(self, question: str, version: int, answer: str):
+        if version != self.version:
+            self._reset(version)
+
+        key = shingles(question)
+        if not key or not answer:
+            return
+        if key in self.entries:
+            self._evict(key)
+
+        signature = minhash(key)
+        self.entries[key] = {'signature': signature, 'answer': answer}
+        for band in _bands(signature):
+            self.buckets.setdefault(band, set()).add(key)
+
+        while len(self.entries) > MAX_ENTRIES:
+            self._evict(next(iter(self.entries)))
+
+    def get_report(self) -> str:
+        stats = self.stats
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        return (
+            f"回答缓存: {len(self.entries)} 条, 命中 {stats['hits']} 次 ({ratio:.1f}%, 其中近似问题 {stats['near_hits']} 次), "
+            f"因知识库变更清空 {stats['invalidations']} 次"
+        )
+
+
+autoreply_cache = AutoreplyCache()
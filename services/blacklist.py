@@ -2,7 +2,7 @@ import time
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.helpers import escape_markdown
 from database import models as db
-from services.gemini_service import gemini_service
+from services.challenge_pool import challenge_pool
 from config import config
 
 pending_unblocks = {}
@@ -66,7 +66,7 @@ async def start_unblock_process(user_id: int):
                 f"如果您认为这是误操作，请回答以下问题以自动解封：\n\n{question}"
             ), keyboard
     
-    challenge = await gemini_service.generate_unblock_question()
+    challenge = challenge_pool.take()
     question = challenge['question']
     correct_answer = challenge['correct_answer']
     options = challenge['options']
@@ -0,0 +1,140 @@
+import asyncio
+import time
+from collections import OrderedDict
+from telegram import MessageEntity
+from database import models as db
+
+BURST_MAX_MESSAGES = 10
+MAX_MESSAGE_LENGTH = 4096
+MAX_TRACKED_POSTS = 1000
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def merge_text_messages(parts: list) -> tuple:
+    text = ""
+    entities = []
+    for part_text, part_entities in parts:
+        if text:
+            text += "\n"
+        shift = _utf16_len(text)
+        for entity in part_entities or ():
+            entities.append(MessageEntity(
+                type=entity.type,
+                offset=entity.offset + shift,
+                length=entity.length,
+                url=entity.url,
+                user=entity.user,
+                language=entity.language,
+                custom_emoji_id=entity.custom_emoji_id,
+            ))
+        text += part_text
+    return text, entities
+
+
+class BurstCoalescer:
+    def __init__(self):
+        self.bursts = {}
+        self.flushing = {}
+        self.posts = OrderedDict()
+        self.tasks = set()
+        self.stats = {'bursts': 0, 'messages': 0}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def _start_flush(self, user_id: int, burst: dict) -> asyncio.Task:
+        task = self._spawn(self._flush(self.flushing.get(user_id), burst))
+        self.flushing[user_id] = task
+        task.add_done_callback(lambda done: self.flushing.get(user_id) is done and self.flushing.pop(user_id))
+        return task
+
+    async def add(self, update, context, handler) -> bool:
+        user_id = update.effective_user.id
+        burst = self.bursts.get(user_id)
+        window = int(await db.get_setting('burst_coalesce_ms', '0')) / 1000
+        if window <= 0 and burst is None:
+            return False
+
+        length = _utf16_len(update.message.text)
+        if burst and burst['length'] + 1 + length > MAX_MESSAGE_LENGTH:
+            self._start_flush(user_id, self.bursts.pop(user_id))
+            burst = None
+        if burst is None:
+            burst = self.bursts[user_id] = {
+                'updates': [], 'length': -1, 'last_seen': 0.0,
+                'window': window, 'context': context, 'handler': handler,
+            }
+            self._spawn(self._flush_later(user_id, burst))
+        burst['updates'].append(update)
+        burst['length'] += 1 + length
+        burst['last_seen'] = time.monotonic()
+
+        if len(burst['updates']) >= BURST_MAX_MESSAGES:
+            self.bursts.pop(user_id, None)
+            self._start_flush(user_id, burst)
+        return True
+
+    async def wait(self, user_id: int):
+        burst = self.bursts.pop(user_id, None)
+        if burst:
+            self._start_flush(user_id, burst)
+        task = self.flushing.get(user_id)
+        if task:
+            await asyncio.wait({task})
+
+    async def _flush_later(self, user_id: int, burst: dict):
+        while True:
+            remaining = burst['window'] - (time.monotonic() - burst['last_seen'])
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        if self.bursts.get(user_id) is burst:
+            self.bursts.pop(user_id)
+            self._start_flush(user_id, burst)
+
+    async def _flush(self, previous: asyncio.Task, burst: dict):
+        if previous:
+            await asyncio.wait({previous})
+        updates = sorted(burst['updates'], key=lambda update: update.message.message_id)
+        self.stats['bursts'] += 1
+        self.stats['messages'] += len(updates)
+        try:
+            await burst['handler'](updates, burst['context'])
+        except Exception as e:
+            print(f"处理连续消息失败: {e}")
+
+    def remember_post(self, user_id: int, parts: list, forum_message_id: int):
+        post = {'forum_message_id': forum_message_id, 'parts': parts}
+        for message_id, _, _ in parts:
+            self.posts[(user_id, message_id)] = post
+            self.posts.move_to_end((user_id, message_id))
+        while len(self.posts) > MAX_TRACKED_POSTS:
+            self.posts.popitem(last=False)
+
+    def has_post(self, user_id: int, message_id: int) -> bool:
+        return (user_id, message_id) in self.posts
+
+    def edit_post(self, user_id: int, message) -> tuple:
+        post = self.posts[(user_id, message.message_id)]
+        for part in post['parts']:
+            if part[0] == message.message_id:
+                part[1], part[2] = message.text, message.entities
+        text, entities = merge_text_messages([(part[1], part[2]) for part in post['parts']])
+        return post['forum_message_id'], text, entities
+
+    def get_report(self) -> str:
+        stats = self.stats
+        average = stats['messages'] / stats['bursts'] if stats['bursts'] else 0
+        return (
+            f"连续消息合并: {stats['bursts']} 次, {stats['messages']} 条消息 (平均 {average:.1f} 条/次), "
+            f"收集中 {len(self.bursts)} 人"
+        )
+
+
+burst_coalescer = BurstCoalescer()
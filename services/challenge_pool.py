@@ -0,0 +1,162 @@
+import asyncio
+import random
+import re
+from collections import deque
+from database import models as db
+from services.ai_scheduler import PRIORITY_VERIFICATION, PRIORITY_BACKGROUND
+from services.ai_service import ai_service
+from services.local_challenges import local_challenge_engine
+
+DEFAULT_POOL_SIZE = 20
+REFILL_INTERVAL = 15
+REFILL_CONCURRENCY = 2
+LOW_WATERMARK_RATIO = 0.5
+RECENT_QUESTIONS = 500
+MAX_QUESTION_LENGTH = 200
+MAX_CALLBACK_BYTES = 64
+CALLBACK_PREFIXES = ("verify_", "unblock_")
+
+
+def _question_key(question: str) -> str:
+    return re.sub(r'[\s\W_]+', '', question).casefold()
+
+
+def _fits_callback(option: str) -> bool:
+    return all(len(f"{prefix}{option}".encode('utf-8')) <= MAX_CALLBACK_BYTES for prefix in CALLBACK_PREFIXES)
+
+
+def validate_challenge(challenge: dict) -> dict:
+    if not isinstance(challenge, dict):
+        return None
+    question = challenge.get('question')
+    correct_answer = challenge.get('correct_answer')
+    options = challenge.get('options')
+    if not isinstance(question, str) or not question.strip() or len(question) > MAX_QUESTION_LENGTH:
+        return None
+    if not isinstance(correct_answer, str) or not isinstance(options, list):
+        return None
+
+    options = [option.strip() for option in options if isinstance(option, str) and option.strip()]
+    correct_answer = correct_answer.strip()
+    if len(options) < 2 or len(set(options)) != len(options) or correct_answer not in options:
+        return None
+    if not all(_fits_callback(option) for option in options):
+        return None
+
+    random.shuffle(options)
+    return {
+        "question": question.strip(),
+        "correct_answer": correct_answer,
+        "options": options,
+    }
+
+
+class ChallengePool:
+    def __init__(self):
+        self.challenges = deque()
+        self.target_size = DEFAULT_POOL_SIZE
+        self.provider = 'ai'
+        self.recent_keys = deque(maxlen=RECENT_QUESTIONS)
+        self.recent_set = set()
+        self.refill_task = None
+        self.refilling = False
+        self.stats = {'served': 0, 'fallbacks': 0, 'generated': 0, 'rejected': 0, 'duplicates': 0}
+
+    def take(self, allow_image: bool = False) -> dict:
+        if self.provider == 'local':
+            return local_challenge_engine.take(allow_image)
+
+        if len(self.challenges) <= self.target_size * LOW_WATERMARK_RATIO:
+            self.schedule_refill()
+
+        if self.challenges:
+            self.stats['served'] += 1
+            return self.challenges.popleft()
+
+        self.stats['fallbacks'] += 1
+        return local_challenge_engine.take(allow_image)
+
+    def schedule_refill(self):
+        if self.refill_task is None or self.refill_task.done():
+            try:
+                self.refill_task = asyncio.get_running_loop().create_task(self.refill())
+            except RuntimeError:
+                pass
+
+    def _remember(self, key: str):
+        if len(self.recent_keys) == self.recent_keys.maxlen:
+            self.recent_set.discard(self.recent_keys[0])
+        self.recent_keys.append(key)
+        self.recent_set.add(key)
+
+    def _add(self, challenge) -> bool:
+        if isinstance(challenge, Exception):
+            return False
+        challenge = validate_challenge(challenge)
+        if not challenge:
+            self.stats['rejected'] += 1
+            return False
+        key = _question_key(challenge['question'])
+        if key in self.recent_set:
+            self.stats['duplicates'] += 1
+            return False
+        self._remember(key)
+        self.challenges.append(challenge)
+        self.stats['generated'] += 1
+        return True
+
+    async def refill(self):
+        if self.refilling:
+            return
+        self.refilling = True
+        try:
+            self.provider = await db.get_setting('verification_provider', 'ai')
+            await local_challenge_engine.refill()
+            if self.provider != 'local' and await ai_service.has_provider():
+                await self._fill()
+        finally:
+            self.refilling = False
+
+    async def _fill(self):
+        self.target_size = int(await db.get_setting('challenge_pool_size', str(DEFAULT_POOL_SIZE)))
+        while len(self.challenges) < self.target_size:
+            batch = min(REFILL_CONCURRENCY, self.target_size - len(self.challenges))
+            low = len(self.challenges) <= self.target_size * LOW_WATERMARK_RATIO
+            priority = PRIORITY_VERIFICATION if low else PRIORITY_BACKGROUND
+            results = await asyncio.gather(
+                *[ai_service.generate_challenge(priority) for _ in range(batch)],
+                return_exceptions=True,
+            )
+            added = [self._add(result) for result in results]
+            if not any(added):
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    print(f"验证题池补充失败: {errors[0]}")
+                break
+
+    def get_report(self) -> str:
+        stats = self.stats
+        engine = "本地生成" if self.provider == 'local' else "AI 生成"
+        return (
+            f"验证引擎: {engine}\n"
+            f"题池: {len(self.challenges)}/{self.target_size}, 已发放 {stats['served']}, "
+            f"本地兜底 {stats['fallbacks']}, 生成 {stats['generated']}, "
+            f"丢弃 {stats['rejected'] + stats['duplicates']} (重复 {stats['duplicates']})\n"
+            f"{local_challenge_engine.get_report()}"
+        )
+
+
+async def _refill_job(context):
+    await challenge_pool.refill()
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _refill_job,
+        interval=REFILL_INTERVAL,
+        first=1,
+        name="challenge_pool_refill",
+    )
+
+
+challenge_pool = ChallengePool()
@@ -0,0 +1,120 @@
+import asyncio
+import math
+import re
+from collections import Counter
+from database import models as db
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2
+DEFAULT_TOP_K = 3
+DEFAULT_MIN_SCORE = 0.0
+
+_CJK_RUN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+_WORD = re.compile(r'[a-z0-9_]+')
+
+
+def tokenize(text: str) -> list:
+    text = (text or "").lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class KnowledgeIndex:
+    def __init__(self):
+        self.version = None
+        self.entries = {}
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.postings = {}
+        self.total_length = 0
+        self.lock = asyncio.Lock()
+        self.stats = {'queries': 0, 'skipped': 0, 'selected': 0, 'syncs': 0}
+
+    def _remove(self, entry_id: int):
+        for term in self.doc_terms.pop(entry_id, {}):
+            docs = self.postings[term]
+            docs.pop(entry_id, None)
+            if not docs:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(entry_id, 0)
+        self.entries.pop(entry_id, None)
+
+    def _add(self, entry: dict):
+        tokens = tokenize(entry['title']) * TITLE_WEIGHT + tokenize(entry['content'])
+        terms = Counter(tokens)
+        self.entries[entry['id']] = entry
+        self.doc_terms[entry['id']] = terms
+        self.doc_lengths[entry['id']] = len(tokens)
+        self.total_length += len(tokens)
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[entry['id']] = count
+
+    async def sync(self):
+        version = await db.get_knowledge_base_version()
+        if version == self.version:
+            return
+        async with self.lock:
+            if version == self.version:
+                return
+            current = {entry['id']: entry for entry in await db.get_all_knowledge_entries()}
+            for entry_id in list(self.entries):
+                if entry_id not in current:
+                    self._remove(entry_id)
+            for entry_id, entry in current.items():
+                known = self.entries.get(entry_id)
+                if known and known['title'] == entry['title'] and known['content'] == entry['content']:
+                    continue
+                self._remove(entry_id)
+                self._add(entry)
+            self.version = version
+            self.stats['syncs'] += 1
+
+    def search(self, question: str, top_k: int = DEFAULT_TOP_K) -> list:
+        if not self.entries:
+            return []
+        doc_count = len(self.entries)
+        average_length = self.total_length / doc_count or 1
+        query_terms = Counter(tokenize(question))
+        query_norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(query_terms.values()) / average_length)
+        scores = Counter()
+        self_score = 0.0
+        for term, query_count in query_terms.items():
+            docs = self.postings.get(term, {})
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            self_score += idf * query_count * (BM25_K1 + 1) / (query_count + query_norm)
+            for entry_id, count in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[entry_id] / average_length)
+                scores[entry_id] += idf * count * (BM25_K1 + 1) / (count + norm)
+        if not self_score:
+            return []
+        return [(score / self_score, self.entries[entry_id]) for entry_id, score in scores.most_common(top_k)]
+
+    async def build_context(self, question: str) -> str:
+        await self.sync()
+        settings = await db.get_settings(['knowledge_top_k', 'knowledge_min_score'])
+        top_k = int(settings.get('knowledge_top_k', DEFAULT_TOP_K))
+        min_score = float(settings.get('knowledge_min_score', DEFAULT_MIN_SCORE))
+
+        self.stats['queries'] += 1
+        results = [entry for score, entry in self.search(question, top_k) if score > 0 and score >= min_score]
+        if not results:
+            self.stats['skipped'] += 1
+            return ""
+        self.stats['selected'] += len(results)
+        return db.format_knowledge_entries(results)
+
+    def get_report(self) -> str:
+        stats = self.stats
+        answered = stats['queries'] - stats['skipped']
+        average = stats['selected'] / answered if answered else 0
+        return (
+            f"索引条目: {len(self.entries)}, 词项: {len(self.postings)}\n"
+            f"检索 {stats['queries']} 次, 无相关条目跳过 {stats['skipped']} 次, 平均选用 {average:.1f} 条"
+        )
+
+
+knowledge_index = KnowledgeIndex()
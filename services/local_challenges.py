@@ -0,0 +1,206 @@
+import asyncio
+import io
+import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+IMAGE_CHALLENGE_RATIO = 0.5
+PRERENDER_SIZE = 10
+RENDER_WORKERS = 2
+CAPTCHA_LENGTH = 5
+CAPTCHA_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CAPTCHA_SIZE = (220, 80)
+
+ORDERED_SETS = [
+    ("以下哪种动物体型最大？", "以下哪种动物体型最小？", ["蚂蚁", "老鼠", "兔子", "狗", "马", "大象"]),
+    ("以下哪个时间单位最长？", "以下哪个时间单位最短？", ["秒", "分钟", "小时", "天", "星期", "月", "年"]),
+    ("以下哪个长度单位最长？", "以下哪个长度单位最短？", ["毫米", "厘米", "分米", "米", "千米"]),
+    ("以下哪个重量单位最重？", "以下哪个重量单位最轻？", ["毫克", "克", "千克", "吨"]),
+]
+
+CATEGORIES = {
+    "水果": ["苹果", "香蕉", "橘子", "葡萄", "西瓜", "梨", "桃子", "草莓"],
+    "动物": ["猫", "狗", "老虎", "兔子", "大象", "熊猫", "猴子", "马"],
+    "颜色": ["红色", "黄色", "蓝色", "绿色", "紫色", "白色", "黑色"],
+    "交通工具": ["汽车", "火车", "飞机", "轮船", "自行车", "地铁", "公交车"],
+    "家具": ["桌子", "椅子", "沙发", "床", "衣柜", "书架"],
+    "文具": ["铅笔", "橡皮", "尺子", "钢笔", "笔记本", "胶水"],
+    "乐器": ["钢琴", "吉他", "小提琴", "鼓", "笛子", "二胡"],
+}
+
+
+def _build(question: str, correct_answer: str, incorrect_answers: list) -> dict:
+    options = incorrect_answers + [correct_answer]
+    random.shuffle(options)
+    return {
+        "question": question,
+        "correct_answer": correct_answer,
+        "options": options,
+    }
+
+
+def _numeric_distractors(answer: int, count: int = 3) -> list:
+    distractors = set()
+    while len(distractors) < count:
+        candidate = answer + random.choice([-1, 1]) * random.randint(1, 10)
+        if candidate != answer and candidate >= 0:
+            distractors.add(candidate)
+    return [str(value) for value in distractors]
+
+
+def arithmetic_challenge() -> dict:
+    kind = random.choice(["+", "-", "×", "+×"])
+    if kind == "+":
+        a, b = random.randint(10, 99), random.randint(10, 99)
+        question, answer = f"{a} + {b} = ?", a + b
+    elif kind == "-":
+        a = random.randint(20, 99)
+        b = random.randint(1, a)
+        question, answer = f"{a} - {b} = ?", a - b
+    elif kind == "×":
+        a, b = random.randint(2, 12), random.randint(2, 12)
+        question, answer = f"{a} × {b} = ?", a * b
+    else:
+        a, b, c = random.randint(1, 20), random.randint(2, 9), random.randint(2, 9)
+        question, answer = f"{a} + {b} × {c} = ?", a + b * c
+    return _build(f"请计算：{question}", str(answer), _numeric_distractors(answer))
+
+
+def ordering_challenge() -> dict:
+    if random.random() < 0.3:
+        numbers = random.sample(range(1, 1000), 4)
+        pick_max = random.random() < 0.5
+        answer = max(numbers) if pick_max else min(numbers)
+        question = "以下哪个数字最大？" if pick_max else "以下哪个数字最小？"
+        return _build(question, str(answer), [str(n) for n in numbers if n != answer])
+
+    question_max, question_min, ordered = random.choice(ORDERED_SETS)
+    items = sorted(random.sample(ordered, 4), key=ordered.index)
+    if random.random() < 0.5:
+        return _build(question_max, items[-1], items[:-1])
+    return _build(question_min, items[0], items[1:])
+
+
+def odd_one_out_challenge() -> dict:
+    category, other = random.sample(list(CATEGORIES), 2)
+    if random.random() < 0.5:
+        members = random.sample(CATEGORIES[category], 3)
+        outlier = random.choice(CATEGORIES[other])
+        return _build(f"以下哪个不属于{category}？", outlier, members)
+
+    others = [item for name, items in CATEGORIES.items() if name != category for item in items]
+    return _build(f"以下哪个属于{category}？", random.choice(CATEGORIES[category]), random.sample(others, 3))
+
+
+TEXT_GENERATORS = [arithmetic_challenge, ordering_challenge, odd_one_out_challenge]
+
+
+def _load_font(size: int):
+    for name in ("DejaVuSans-Bold.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _mutate(code: str) -> str:
+    chars = list(code)
+    for position in random.sample(range(len(chars)), random.randint(1, 2)):
+        chars[position] = random.choice([c for c in CAPTCHA_ALPHABET if c != chars[position]])
+    return "".join(chars)
+
+
+def render_image_challenge() -> dict:
+    code = "".join(random.choices(CAPTCHA_ALPHABET, k=CAPTCHA_LENGTH))
+    width, height = CAPTCHA_SIZE
+    image = Image.new("RGB", CAPTCHA_SIZE, (random.randint(225, 255),) * 3)
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(6):
+        draw.line(
+            [(random.randint(0, width), random.randint(0, height)) for _ in range(2)],
+            fill=tuple(random.randint(100, 200) for _ in range(3)),
+            width=2,
+        )
+
+    step = width // (CAPTCHA_LENGTH + 1)
+    for index, char in enumerate(code):
+        font = _load_font(random.randint(34, 44))
+        glyph = Image.new("RGBA", (56, 64), (0, 0, 0, 0))
+        ImageDraw.Draw(glyph).text((8, 4), char, font=font, fill=tuple(random.randint(0, 110) for _ in range(3)))
+        glyph = glyph.rotate(random.uniform(-30, 30), resample=Image.BICUBIC, expand=False)
+        image.paste(glyph, (step * index + random.randint(4, 14), random.randint(0, 14)), glyph)
+
+    for _ in range(400):
+        draw.point((random.randint(0, width - 1), random.randint(0, height - 1)), fill=tuple(random.randint(0, 255) for _ in range(3)))
+
+    image = image.filter(ImageFilter.SMOOTH)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+
+    distractors = set()
+    while len(distractors) < 3:
+        distractors.add(_mutate(code))
+    challenge = _build("请选择图片中显示的字符：", code, list(distractors))
+    challenge["image"] = output.getvalue()
+    return challenge
+
+
+class LocalChallengeEngine:
+    def __init__(self):
+        self.images = deque()
+        self.executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="captcha")
+        self.refill_task = None
+        self.refilling = False
+        self.stats = {'text': 0, 'image': 0, 'rendered': 0}
+
+    def take(self, allow_image: bool = True) -> dict:
+        if allow_image and random.random() < IMAGE_CHALLENGE_RATIO:
+            if len(self.images) <= PRERENDER_SIZE // 2:
+                self.schedule_refill()
+            if self.images:
+                self.stats['image'] += 1
+                return self.images.popleft()
+
+        self.stats['text'] += 1
+        return random.choice(TEXT_GENERATORS)()
+
+    def schedule_refill(self):
+        if self.refill_task is None or self.refill_task.done():
+            try:
+                self.refill_task = asyncio.get_running_loop().create_task(self.refill())
+            except RuntimeError:
+                pass
+
+    async def refill(self):
+        if self.refilling:
+            return
+        self.refilling = True
+        loop = asyncio.get_running_loop()
+        try:
+            while len(self.images) < PRERENDER_SIZE:
+                batch = min(RENDER_WORKERS, PRERENDER_SIZE - len(self.images))
+                rendered = await asyncio.gather(*[
+                    loop.run_in_executor(self.executor, render_image_challenge) for _ in range(batch)
+                ])
+                self.images.extend(rendered)
+                self.stats['rendered'] += len(rendered)
+        except Exception as e:
+            print(f"预渲染图片验证码失败: {e}")
+        finally:
+            self.refilling = False
+
+    def get_report(self) -> str:
+        stats = self.stats
+        return (
+            f"本地题目: 文字 {stats['text']}, 图片 {stats['image']}, "
+            f"预渲染 {len(self.images)}/{PRERENDER_SIZE}"
+        )
+
+
+local_challenge_engine = LocalChallengeEngine()
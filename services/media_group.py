@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+MEDIA_GROUP_WINDOW = 1.0
+MEDIA_GROUP_MAX_SIZE = 10
+
+
+class MediaGroupCollector:
+    def __init__(self):
+        self.groups = {}
+        self.flushing = {}
+        self.tasks = set()
+        self.stats = {'groups': 0, 'messages': 0}
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def _start_flush(self, user_id: int, group: dict) -> asyncio.Task:
+        task = self._spawn(self._flush(self.flushing.get(user_id), group))
+        self.flushing[user_id] = task
+        task.add_done_callback(lambda done: self.flushing.get(user_id) is done and self.flushing.pop(user_id))
+        return task
+
+    async def add(self, update, context, handler):
+        user_id = update.effective_user.id
+        key = (user_id, update.message.media_group_id)
+        group = self.groups.get(key)
+        if group is None:
+            await self.wait(user_id, keep_group=key[1])
+            group = self.groups[key] = {'updates': [], 'last_seen': 0.0, 'context': context, 'handler': handler}
+            self._spawn(self._flush_later(key, group))
+        group['updates'].append(update)
+        group['last_seen'] = time.monotonic()
+
+        if len(group['updates']) >= MEDIA_GROUP_MAX_SIZE:
+            self.groups.pop(key, None)
+            self._start_flush(user_id, group)
+
+    async def wait(self, user_id: int, keep_group=None):
+        for key in [key for key in self.groups if key[0] == user_id and key[1] != keep_group]:
+            self._start_flush(user_id, self.groups.pop(key))
+        task = self.flushing.get(user_id)
+        if task:
+            await asyncio.wait({task})
+
+    async def _flush_later(self, key, group: dict):
+        while True:
+            remaining = MEDIA_GROUP_WINDOW - (time.monotonic() - group['last_seen'])
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        if self.groups.get(key) is group:
+            self.groups.pop(key)
+            self._start_flush(key[0], group)
+
+    async def _flush(self, previous: asyncio.Task, group: dict):
+        if previous:
+            await asyncio.wait({previous})
+        updates = sorted(group['updates'], key=lambda update: update.message.message_id)
+        self.stats['groups'] += 1
+        self.stats['messages'] += len(updates)
+        try:
+            await group['handler'](updates, group['context'])
+        except Exception as e:
+            print(f"处理相册消息失败: {e}")
+
+    def get_report(self) -> str:
+        stats = self.stats
+        average = stats['messages'] / stats['groups'] if stats['groups'] else 0
+        return (
+            f"相册合并: {stats['groups']} 组, {stats['messages']} 条消息 (平均 {average:.1f} 条/组), "
+            f"收集中 {len(self.groups)} 组"
+        )
+
+
+media_group_collector = MediaGroupCollector()
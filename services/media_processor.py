@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from utils.media_converter import prepare_image, select_photo_size
+
+MEDIA_WORKERS = 2
+TIMING_WINDOW = 200
+FIRST_FRAME_MAX_BYTES = 2 * 1024 * 1024
+FIRST_FRAME_MIME_TYPES = ('image/gif', 'image/webp')
+
+
+class MediaProcessor:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.timings = deque(maxlen=TIMING_WINDOW)
+        self.stats = {
+            'jobs': 0, 'failures': 0, 'original_bytes': 0, 'uploaded_bytes': 0,
+            'frames_thumbnail': 0, 'frames_first_frame': 0,
+        }
+
+    def _run_job(self, submitted: float, func, args):
+        started = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                self.running -= 1
+                self.timings.append((started - submitted, finished - started))
+
+    async def submit(self, func, *args):
+        with self.lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self._run_job, time.monotonic(), func, args)
+        except Exception:
+            self.stats['failures'] += 1
+            raise
+        finally:
+            self.stats['jobs'] += 1
+
+    def _pick_source(self, message, max_side: int):
+        if message.photo:
+            photo = select_photo_size(message.photo, max_side)
+            return photo, message.photo[-1].file_size, 'photo'
+        if message.sticker:
+            if not message.sticker.is_animated and not message.sticker.is_video:
+                return message.sticker, message.sticker.file_size, 'photo'
+            return message.sticker.thumbnail, message.sticker.file_size, 'thumbnail'
+        if message.animation:
+            if message.animation.thumbnail:
+                return message.animation.thumbnail, message.animation.file_size, 'thumbnail'
+            if message.animation.mime_type in FIRST_FRAME_MIME_TYPES \
+                    and (message.animation.file_size or 0) <= FIRST_FRAME_MAX_BYTES:
+                return message.animation, message.animation.file_size, 'first_frame'
+            return None, None, None
+        media = message.video or message.video_note
+        if media:
+            return media.thumbnail, media.file_size, 'thumbnail'
+        return None, None, None
+
+    def describe_source(self, message, max_side: int) -> tuple:
+        source, _, kind = self._pick_source(message, max_side)
+        if source is None:
+            return None, None
+        return source.file_id, kind
+
+    async def load_image_for_analysis(self, message, max_side: int, byte_budget: int) -> tuple:
+        source, original_size, kind = self._pick_source(message, max_side)
+        if source is None:
+            return None, None
+        return await self._load(await source.get_file(), original_size, kind, max_side, byte_budget)
+
+    async def load_file_for_analysis(self, bot, file_id: str, kind: str, max_side: int, byte_budget: int) -> tuple:
+        return await self._load(await bot.get_file(file_id), None, kind, max_side, byte_budget)
+
+    async def _load(self, source_file, original_size: int, kind: str, max_side: int, byte_budget: int) -> tuple:
+        data = await source_file.download_as_bytearray()
+        if kind != 'photo':
+            self.stats['frames_' + kind] += 1
+
+        image_bytes, image_hash = await self.submit(prepare_image, bytes(data), max_side, byte_budget)
+        if image_bytes:
+            self.stats['original_bytes'] += original_size or len(data)
+            self.stats['uploaded_bytes'] += len(image_bytes)
+        return image_bytes, image_hash
+
+    def get_report(self) -> str:
+        stats = self.stats
+        saved = stats['original_bytes'] - stats['uploaded_bytes']
+        ratio = saved / stats['original_bytes'] * 100 if stats['original_bytes'] else 0
+        timings = list(self.timings)
+        average_wait = sum(wait for wait, _ in timings) / len(timings) * 1000 if timings else 0
+        average_run = sum(run for _, run in timings) / len(timings) * 1000 if timings else 0
+        max_run = max((run for _, run in timings), default=0) * 1000
+        return (
+            f"图片预处理: {stats['jobs']} 次 (失败 {stats['failures']}), 排队 {self.queued}, 处理中 {self.running}\n"
+            f"平均排队 {average_wait:.0f}ms, 平均处理 {average_run:.0f}ms, 最长 {max_run:.0f}ms\n"
+            f"上传 {stats['uploaded_bytes'] / 1024:.0f} KB, 节省 {saved / 1024:.0f} KB ({ratio:.1f}%)\n"
+            f"视频/动图抽帧: 缩略图 {stats['frames_thumbnail']} 次, 首帧解码 {stats['frames_first_frame']} 次"
+        )
+
+
+media_processor = MediaProcessor()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from database import models as db
+
+CACHE_SIZE = 5000
+RETENTION_DAYS = 90
+PRUNE_INTERVAL = 24 * 3600
+
+
+class MessageMap:
+    def __init__(self):
+        self.by_user = OrderedDict()
+        self.by_forum = OrderedDict()
+        self.stats = {'recorded': 0, 'hits': 0, 'misses': 0}
+
+    def _remember(self, entry: tuple):
+        user_id, user_message_id, forum_message_id, _ = entry
+        for cache, key in ((self.by_user, (user_id, user_message_id)), (self.by_forum, forum_message_id)):
+            cache[key] = entry
+            cache.move_to_end(key)
+            while len(cache) > CACHE_SIZE:
+                cache.popitem(last=False)
+
+    async def record(self, user_id: int, user_message_id: int, forum_message_id: int, thread_id: int):
+        entry = (user_id, user_message_id, forum_message_id, thread_id)
+        self._remember(entry)
+        self.stats['recorded'] += 1
+        try:
+            await db.save_message_mapping(*entry)
+        except Exception as e:
+            print(f"保存消息映射失败: {e}")
+
+    async def _lookup(self, cache: OrderedDict, key, loader) -> tuple:
+        entry = cache.get(key)
+        if entry:
+            cache.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry
+        self.stats['misses'] += 1
+        row = await loader()
+        if not row:
+            return None
+        entry = tuple(row)
+        self._remember(entry)
+        return entry
+
+    async def get_forum_message(self, user_id: int, user_message_id: int) -> tuple:
+        entry = await self._lookup(
+            self.by_user,
+            (user_id, user_message_id),
+            lambda: db.get_mapping_by_user_message(user_id, user_message_id),
+        )
+        return (entry[2], entry[3]) if entry else None
+
+    async def get_user_message(self, forum_message_id: int) -> tuple:
+        entry = await self._lookup(
+            self.by_forum,
+            forum_message_id,
+            lambda: db.get_mapping_by_forum_message(forum_message_id),
+        )
+        return (entry[0], entry[1]) if entry else None
+
+    def get_report(self) -> str:
+        stats = self.stats
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        return (
+            f"消息映射: 记录 {stats['recorded']} 条, 缓存 {len(self.by_forum)}/{CACHE_SIZE}, "
+            f"命中率 {ratio:.1f}%"
+        )
+
+
+async def _prune_job(context):
+    try:
+        await db.prune_message_mappings(RETENTION_DAYS)
+    except Exception as e:
+        print(f"清理消息映射失败: {e}")
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _prune_job,
+        interval=PRUNE_INTERVAL,
+        first=60,
+        name="message_map_prune",
+    )
+
+
+message_map = MessageMap()
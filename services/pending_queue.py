@@ -0,0 +1,85 @@
+import time
+from collections import deque
+
+MAX_PENDING_MESSAGES = 20
+PENDING_TTL = 3600
+MAX_PENDING_USERS = 1000
+
+
+def _media_of(message) -> tuple:
+    for media_type in ('photo', 'video', 'animation', 'sticker', 'document', 'voice', 'audio', 'video_note'):
+        media = getattr(message, media_type, None)
+        if media:
+            return media_type, media[-1].file_id if media_type == 'photo' else media.file_id
+    return None, None
+
+
+class PendingQueue:
+    def __init__(self):
+        self.queues = {}
+        self.stats = {'queued': 0, 'replayed': 0, 'dropped': 0, 'expired': 0}
+
+    def _queue(self, user_id: int) -> deque:
+        queue = self.queues.get(user_id)
+        if queue is None:
+            queue = self.queues[user_id] = deque()
+        now = time.monotonic()
+        while queue and now - queue[0]['added_at'] > PENDING_TTL:
+            queue.popleft()
+            self.stats['expired'] += 1
+        return queue
+
+    def _sweep(self):
+        for user_id in list(self.queues):
+            if not self._queue(user_id):
+                del self.queues[user_id]
+
+    def add(self, user_id: int, message, image_source: tuple = (None, None)):
+        if user_id not in self.queues and len(self.queues) >= MAX_PENDING_USERS:
+            self._sweep()
+        queue = self._queue(user_id)
+        if any(entry['message_id'] == message.message_id for entry in queue):
+            return
+        media_type, media_file_id = _media_of(message)
+        queue.append({
+            'chat_id': message.chat_id,
+            'message_id': message.message_id,
+            'text': message.text,
+            'caption': message.caption,
+            'media_type': media_type,
+            'media_file_id': media_file_id,
+            'image_file_id': image_source[0],
+            'image_kind': image_source[1],
+            'added_at': time.monotonic(),
+        })
+        self.stats['queued'] += 1
+        while len(queue) > MAX_PENDING_MESSAGES:
+            queue.popleft()
+            self.stats['dropped'] += 1
+
+    def requeue(self, user_id: int, entries: list):
+        queue = self._queue(user_id)
+        queued_ids = {entry['message_id'] for entry in queue}
+        merged = [entry for entry in entries if entry['message_id'] not in queued_ids] + list(queue)
+        merged.sort(key=lambda entry: entry['message_id'])
+        queue.clear()
+        queue.extend(merged[-MAX_PENDING_MESSAGES:])
+
+    def take(self, user_id: int) -> list:
+        if user_id not in self.queues:
+            return []
+        entries = list(self._queue(user_id))
+        del self.queues[user_id]
+        self.stats['replayed'] += len(entries)
+        return entries
+
+    def get_report(self) -> str:
+        stats = self.stats
+        waiting = sum(len(queue) for queue in self.queues.values())
+        return (
+            f"验证前暂存: {waiting} 条 ({len(self.queues)} 人), 累计 {stats['queued']}, 验证后转发 {stats['replayed']}, "
+            f"超量丢弃 {stats['dropped']}, 过期 {stats['expired']}"
+        )
+
+
+pending_queue = PendingQueue()
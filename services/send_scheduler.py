@@ -0,0 +1,186 @@
+import asyncio
+import bisect
+import itertools
+import time
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import config
+
+PRIORITY_USER = 0
+PRIORITY_FORUM = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_RSS = 3
+PRIORITY_NAMES = {
+    PRIORITY_USER: "用户回复",
+    PRIORITY_FORUM: "话题群组",
+    PRIORITY_BACKGROUND: "后台更新",
+    PRIORITY_RSS: "RSS 推送",
+}
+
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+GROUP_RATE = 20 / 60
+GROUP_BURST = 20
+PRIVATE_RATE = 1
+PRIVATE_BURST = 3
+MAX_RETRY_AFTER_ATTEMPTS = 2
+MAX_CHAT_BUCKETS = 1000
+UNLIMITED_ENDPOINTS = ('getChat', 'getChatMember', 'getChatAdministrators', 'getChatMemberCount', 'sendChatAction')
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self._refill(now)
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def consume(self, cost: int):
+        self.tokens -= cost
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class SendScheduler(BaseRateLimiter):
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chat_buckets = {}
+        self.pending = []
+        self.sequence = itertools.count()
+        self.wakeup = None
+        self.dispatcher = None
+        self.waits = {priority: [0, 0.0, 0.0] for priority in PRIORITY_NAMES}
+        self.stats = {'sent': 0, 'retry_after': 0, 'gave_up': 0}
+
+    async def initialize(self):
+        self.wakeup = asyncio.Event()
+        self.dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            try:
+                await self.dispatcher
+            except asyncio.CancelledError:
+                pass
+            self.dispatcher = None
+        for *_, future, _, _ in self.pending:
+            future.cancel()
+        self.pending.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                for key in [key for key, value in self.chat_buckets.items() if value.is_idle(now)]:
+                    del self.chat_buckets[key]
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = TokenBucket(GROUP_RATE, GROUP_BURST) if is_group else TokenBucket(PRIVATE_RATE, PRIVATE_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _priority(self, chat_id, rate_limit_args) -> int:
+        if isinstance(rate_limit_args, dict) and 'priority' in rate_limit_args:
+            return rate_limit_args['priority']
+        if isinstance(chat_id, int) and chat_id > 0:
+            return PRIORITY_USER
+        if str(chat_id) == str(config.FORUM_GROUP_ID):
+            return PRIORITY_FORUM
+        return PRIORITY_BACKGROUND
+
+    async def _acquire(self, priority: int, bucket: TokenBucket, cost: int):
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self.pending, (priority, next(self.sequence), future, bucket, cost))
+        self.wakeup.set()
+        started = time.monotonic()
+        await future
+        waited = time.monotonic() - started
+        stats = self.waits.setdefault(priority, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += waited
+        stats[2] = max(stats[2], waited)
+
+    async def _dispatch(self):
+        while True:
+            self.wakeup.clear()
+            now = time.monotonic()
+            timeout = None
+            remaining = []
+            for item in self.pending:
+                _, _, future, bucket, cost = item
+                if future.done():
+                    continue
+                delay = max(self.global_bucket.delay(now), bucket.delay(now))
+                if delay <= 0:
+                    self.global_bucket.consume(cost)
+                    bucket.consume(cost)
+                    future.set_result(None)
+                    continue
+                remaining.append(item)
+                timeout = delay if timeout is None else min(timeout, delay)
+            self.pending = remaining
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None or endpoint in UNLIMITED_ENDPOINTS or self.dispatcher is None:
+            return await callback(*args, **kwargs)
+
+        priority = self._priority(chat_id, rate_limit_args)
+        bucket = self._chat_bucket(chat_id)
+        cost = len(data.get('media') or ()) if endpoint == 'sendMediaGroup' else 1
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            await self._acquire(priority, bucket, max(cost, 1))
+            try:
+                result = await callback(*args, **kwargs)
+                self.stats['sent'] += 1
+                return result
+            except RetryAfter as e:
+                self.stats['retry_after'] += 1
+                bucket.pause(_retry_after_seconds(e))
+                if attempt >= MAX_RETRY_AFTER_ATTEMPTS:
+                    self.stats['gave_up'] += 1
+                    raise
+                print(f"发送到 {chat_id} 触发限流，暂停该会话 {_retry_after_seconds(e):.0f} 秒")
+
+    def get_report(self) -> str:
+        now = time.monotonic()
+        paused = sum(1 for bucket in self.chat_buckets.values() if bucket.paused_until > now)
+        lines = [
+            f"已发送: {self.stats['sent']}, 排队: {len(self.pending)}, 会话桶: {len(self.chat_buckets)} (暂停 {paused})",
+            f"限流重试: {self.stats['retry_after']} 次, 放弃 {self.stats['gave_up']} 次",
+        ]
+        for priority, name in PRIORITY_NAMES.items():
+            count, total, longest = self.waits[priority]
+            if count:
+                lines.append(f"{name}: {count} 次, 平均等待 {total / count * 1000:.0f}ms, 最长 {longest * 1000:.0f}ms")
+        return "\n".join(lines)
+
+
+send_scheduler = SendScheduler()
@@ -0,0 +1,220 @@
+import asyncio
+import math
+import random
+import re
+import zlib
+from database import models as db
+
+HASH_BUCKETS = 1 << 18
+MIN_SAMPLES_PER_CLASS = 30
+MIN_FEATURES = 4
+SHORT_CIRCUIT_PROBABILITY = 0.995
+AUDIT_RATE = 0.05
+TRAINING_LIMIT = 5000
+TRAINING_SOURCES = ('llm', 'admin')
+RETRAIN_INTERVAL = 3600
+MESSAGE_RETENTION_DAYS = 90
+PRUNE_INTERVAL = 24 * 3600
+
+_CJK_RUN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]+')
+_WORD = re.compile(r'[a-z0-9_]+')
+_URL = re.compile(r'(https?://|www\.|t\.me/)\S+')
+_MENTION = re.compile(r'@[a-z0-9_]{4,}')
+_DIGITS = re.compile(r'\d+')
+
+
+def extract_features(text: str) -> list:
+    text = (text or "").lower()
+    tokens = []
+    if _URL.search(text):
+        tokens.append("__url__")
+        text = _URL.sub(" ", text)
+    if _MENTION.search(text):
+        tokens.append("__mention__")
+    text = _DIGITS.sub("0", text)
+
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    words = _WORD.findall(text)
+    tokens.extend(words)
+    tokens.extend(f"{words[i]} {words[i + 1]}" for i in range(len(words) - 1))
+
+    return [zlib.crc32(token.encode('utf-8')) % HASH_BUCKETS for token in tokens]
+
+
+class NaiveBayesModel:
+    def __init__(self):
+        self.feature_counts = ({}, {})
+        self.total_counts = [0, 0]
+        self.doc_counts = [0, 0]
+        self.vocabulary = 0
+
+    def learn(self, features: list, is_spam: bool):
+        label = 1 if is_spam else 0
+        counts = self.feature_counts[label]
+        other_counts = self.feature_counts[1 - label]
+        for feature in features:
+            if feature not in counts and feature not in other_counts:
+                self.vocabulary += 1
+            counts[feature] = counts.get(feature, 0) + 1
+        self.total_counts[label] += len(features)
+        self.doc_counts[label] += 1
+
+    def is_ready(self) -> bool:
+        return min(self.doc_counts) >= MIN_SAMPLES_PER_CLASS
+
+    def spam_probability(self, features: list) -> float:
+        vocabulary = self.vocabulary or 1
+        total_docs = sum(self.doc_counts)
+        scores = []
+        for label in (0, 1):
+            counts = self.feature_counts[label]
+            denominator = self.total_counts[label] + vocabulary
+            score = math.log(self.doc_counts[label] / total_docs)
+            for feature in features:
+                score += math.log((counts.get(feature, 0) + 1) / denominator)
+            scores.append(score)
+        diff = scores[0] - scores[1]
+        if diff > 50:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(diff))
+
+
+def _fit(spam_samples: list, ham_samples: list) -> NaiveBayesModel:
+    model = NaiveBayesModel()
+    for text in spam_samples:
+        model.learn(extract_features(text), True)
+    for text in ham_samples:
+        model.learn(extract_features(text), False)
+    return model
+
+
+class SpamClassifier:
+    def __init__(self):
+        self.model = NaiveBayesModel()
+        self.retrain_lock = asyncio.Lock()
+        self.stats = {
+            'local_decisions': 0,
+            'local_spam': 0,
+            'llm_calls': 0,
+            'audits': 0,
+            'audit_agreements': 0,
+            'spam_audits': 0,
+            'spam_audit_agreements': 0,
+            'retrains': 0,
+        }
+
+    async def is_enabled(self) -> bool:
+        return await db.get_setting('local_classifier_enabled', '1') == '1'
+
+    def predict(self, text: str) -> dict:
+        if not self.model.is_ready():
+            return None
+        features = extract_features(text)
+        if len(features) < MIN_FEATURES:
+            return None
+
+        probability = self.model.spam_probability(features)
+        if probability >= SHORT_CIRCUIT_PROBABILITY:
+            return {
+                "is_spam": True,
+                "reason": "本地模型判定为垃圾信息。",
+                "confidence": round(probability * 100),
+                "source": "local",
+            }
+        if probability <= 1 - SHORT_CIRCUIT_PROBABILITY:
+            return {
+                "is_spam": False,
+                "reason": "内容未发现违规。",
+                "confidence": round((1 - probability) * 100),
+                "source": "local",
+            }
+        return None
+
+    def should_audit(self) -> bool:
+        return random.random() < AUDIT_RATE
+
+    def record_local_decision(self, verdict: dict):
+        self.stats['local_decisions'] += 1
+        if verdict.get("is_spam"):
+            self.stats['local_spam'] += 1
+
+    def record_llm_call(self):
+        self.stats['llm_calls'] += 1
+
+    def record_audit(self, local_verdict: dict, llm_verdict: dict):
+        agreed = bool(local_verdict.get("is_spam")) == bool(llm_verdict.get("is_spam"))
+        self.stats['audits'] += 1
+        self.stats['audit_agreements'] += int(agreed)
+        if local_verdict.get("is_spam"):
+            self.stats['spam_audits'] += 1
+            self.stats['spam_audit_agreements'] += int(agreed)
+
+    def learn(self, text: str, is_spam: bool):
+        if not text:
+            return
+        self.model.learn(extract_features(text), is_spam)
+
+    async def retrain(self):
+        if self.retrain_lock.locked():
+            return
+        async with self.retrain_lock:
+            spam_samples = await db.get_spam_training_samples(TRAINING_SOURCES, TRAINING_LIMIT)
+            ham_samples = await db.get_ham_training_samples(TRAINING_SOURCES, TRAINING_LIMIT)
+            self.model = await asyncio.to_thread(_fit, spam_samples, ham_samples)
+            self.stats['retrains'] += 1
+            print(f"本地垃圾信息分类器已重新训练: 垃圾 {len(spam_samples)} 条, 正常 {len(ham_samples)} 条")
+
+    def get_report(self) -> str:
+        stats = self.stats
+        total = stats['local_decisions'] + stats['llm_calls']
+        saved_ratio = stats['local_decisions'] / total * 100 if total else 0
+        if stats['spam_audits']:
+            precision = f"{stats['spam_audit_agreements'] / stats['spam_audits'] * 100:.1f}%"
+        else:
+            precision = "N/A"
+        if stats['audits']:
+            agreement = f"{stats['audit_agreements'] / stats['audits'] * 100:.1f}%"
+        else:
+            agreement = "N/A"
+        status = "已就绪" if self.model.is_ready() else "样本不足"
+        return (
+            f"状态: {status} (垃圾 {self.model.doc_counts[1]} / 正常 {self.model.doc_counts[0]})\n"
+            f"本地判定: {stats['local_decisions']} 次 (拦截 {stats['local_spam']})\n"
+            f"节省 AI 调用: {stats['local_decisions']} 次 ({saved_ratio:.1f}%)\n"
+            f"拦截精确率(抽检): {precision} / 总体一致率: {agreement} ({stats['audits']} 次抽检)"
+        )
+
+
+async def _retrain_job(context):
+    try:
+        await spam_classifier.retrain()
+    except Exception as e:
+        print(f"本地垃圾信息分类器训练失败: {e}")
+
+
+async def _prune_job(context):
+    try:
+        await db.prune_incoming_messages(TRAINING_SOURCES, TRAINING_LIMIT, MESSAGE_RETENTION_DAYS)
+    except Exception as e:
+        print(f"清理已保存的用户消息失败: {e}")
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _retrain_job,
+        interval=RETRAIN_INTERVAL,
+        first=5,
+        name="spam_classifier_retrain",
+    )
+    app.job_queue.run_repeating(
+        _prune_job,
+        interval=PRUNE_INTERVAL,
+        first=60,
+        name="spam_classifier_prune",
+    )
+
+
+spam_classifier = SpamClassifier()
@@ -1,39 +1,100 @@
+import asyncio
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
 from database import models as db
 from config import config
 from datetime import datetime
 from utils.message_sender import send_message_by_type
+from services.topic_health import topic_health, is_missing_thread_error
+from services.topic_pool import topic_pool
 
-async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE) -> tuple[int, bool]:
+_pending_threads = {}
+
+async def get_or_create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, resend: bool = True) -> tuple[int, bool]:
     user = update.effective_user
     user_data = await db.get_user(user.id)
     
     if user_data and user_data.get('thread_id'):
         return user_data['thread_id'], False
-    
+
+    future = _pending_threads.get(user.id)
+    if future is not None:
+        return await asyncio.shield(future), False
+
+    future = asyncio.get_running_loop().create_future()
+    _pending_threads[user.id] = future
+    try:
+        thread_id, is_new = await _create_thread(update, context, resend)
+        future.set_result(thread_id)
+        return thread_id, is_new
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        _pending_threads.pop(user.id, None)
+
+async def _create_thread(update: Update, context: ContextTypes.DEFAULT_TYPE, resend: bool) -> tuple[int, bool]:
+    user = update.effective_user
+    user_data = await db.get_user(user.id)
+    if user_data and user_data.get('thread_id'):
+        return user_data['thread_id'], False
+
     topic_name = f"{user.first_name} (ID: {user.id})"
+    photos_task = asyncio.create_task(_get_profile_photos(context, user.id))
     try:
-        topic = await context.bot.create_forum_topic(
-            chat_id=config.FORUM_GROUP_ID,
-            name=topic_name
-        )
-        thread_id = topic.message_thread_id
+        thread_id = await _claim_pooled_topic(context, topic_name)
+        if thread_id is None:
+            topic = await context.bot.create_forum_topic(
+                chat_id=config.FORUM_GROUP_ID,
+                name=topic_name
+            )
+            thread_id = topic.message_thread_id
         
         await db.update_user_thread_id(user.id, thread_id)
+        topic_health.revive(thread_id)
         
-        await send_user_info_card(update, context, thread_id)
+        await send_user_info_card(update, context, thread_id, resend, await photos_task)
         
         return thread_id, True
     except Exception as e:
         print(f"创建话题失败: {e}")
+        photos_task.cancel()
         return None, False
 
-async def send_user_info_card(update: Update, context: ContextTypes.DEFAULT_TYPE, thread_id: int):
+async def _claim_pooled_topic(context: ContextTypes.DEFAULT_TYPE, topic_name: str) -> int:
+    while True:
+        thread_id = await topic_pool.claim()
+        if thread_id is None:
+            return None
+        topic_pool.schedule_refill(context.bot)
+        try:
+            await context.bot.edit_forum_topic(
+                chat_id=config.FORUM_GROUP_ID,
+                message_thread_id=thread_id,
+                name=topic_name
+            )
+            return thread_id
+        except BadRequest as e:
+            if is_missing_thread_error(e):
+                topic_pool.discard(thread_id)
+                continue
+            print(f"重命名预建话题失败: {e}")
+            return thread_id
+
+async def _get_profile_photos(context: ContextTypes.DEFAULT_TYPE, user_id: int):
+    try:
+        return await context.bot.get_user_profile_photos(user_id, limit=1)
+    except Exception as e:
+        print(f"获取用户头像失败: {e}")
+        return None
+
+async def send_user_info_card(update: Update, context: ContextTypes.DEFAULT_TYPE, thread_id: int, resend: bool = True, photos=None):
     user = update.effective_user
     
-    photos = await context.bot.get_user_profile_photos(user.id, limit=1)
+    if photos is None:
+        photos = await _get_profile_photos(context, user.id)
     
     first_name = escape_markdown(user.first_name or '', version=2)
     last_name = escape_markdown(user.last_name or '', version=2)
@@ -63,5 +124,6 @@ async def send_user_info_card(update: Update, context: ContextTypes.DEFAULT_TYPE
             parse_mode='Markdown'
         )
     
-    from handlers.user_handler import _resend_message
-    await _resend_message(update, context, thread_id)
+    if resend:
+        from handlers.user_handler import _resend_message
+        await _resend_message(update, context, thread_id)
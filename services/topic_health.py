@@ -0,0 +1,106 @@
+import time
+from telegram.error import BadRequest
+from database import models as db
+from config import config
+
+VERIFY_INTERVAL = 600
+VERIFY_BATCH_SIZE = 3
+VERIFY_MIN_AGE = 6 * 3600
+MISSING_THREAD_ERRORS = (
+    "message to forward not found",
+    "message not found",
+    "thread not found",
+    "topic not found",
+)
+
+
+def is_missing_thread_error(error: BadRequest) -> bool:
+    error_text = error.message.lower()
+    return any(marker in error_text for marker in MISSING_THREAD_ERRORS)
+
+
+class TopicHealth:
+    def __init__(self):
+        self.dead = set()
+        self.checked_at = {}
+        self.stats = {'closed_events': 0, 'send_failures': 0, 'probes': 0, 'probe_failures': 0}
+
+    def is_alive(self, thread_id: int) -> bool:
+        return thread_id not in self.dead
+
+    def record_success(self, thread_id: int):
+        if thread_id not in self.dead:
+            self.checked_at[thread_id] = time.monotonic()
+
+    def revive(self, thread_id: int):
+        self.dead.discard(thread_id)
+        self.checked_at[thread_id] = time.monotonic()
+
+    def mark_dead(self, thread_id: int, reason: str):
+        if thread_id in self.dead:
+            return
+        self.dead.add(thread_id)
+        self.checked_at.pop(thread_id, None)
+        self.stats[reason] += 1
+
+    def forget(self, thread_id: int):
+        self.dead.discard(thread_id)
+        self.checked_at.pop(thread_id, None)
+
+    async def _probe(self, bot, thread_id: int):
+        self.stats['probes'] += 1
+        try:
+            probe_msg = await bot.forward_message(
+                chat_id=config.FORUM_GROUP_ID,
+                from_chat_id=config.FORUM_GROUP_ID,
+                message_id=thread_id,
+                message_thread_id=thread_id,
+                disable_notification=True
+            )
+            await bot.delete_message(
+                chat_id=config.FORUM_GROUP_ID,
+                message_id=probe_msg.message_id
+            )
+        except BadRequest as e:
+            if is_missing_thread_error(e):
+                self.mark_dead(thread_id, 'probe_failures')
+                return
+            print(f"话题 {thread_id} 巡检失败: {e}")
+        self.record_success(thread_id)
+
+    async def verify(self, bot):
+        now = time.monotonic()
+        thread_ids = [
+            thread_id for thread_id in await db.get_all_thread_ids()
+            if thread_id not in self.dead and now - self.checked_at.get(thread_id, -VERIFY_MIN_AGE) >= VERIFY_MIN_AGE
+        ]
+        thread_ids.sort(key=lambda thread_id: self.checked_at.get(thread_id, 0))
+        for thread_id in thread_ids[:VERIFY_BATCH_SIZE]:
+            await self._probe(bot, thread_id)
+
+    def get_report(self) -> str:
+        stats = self.stats
+        return (
+            f"待恢复话题: {len(self.dead)} 个 (关闭事件 {stats['closed_events']}, "
+            f"发送失败 {stats['send_failures']}, 巡检发现 {stats['probe_failures']})\n"
+            f"后台巡检: {stats['probes']} 次, 每 {VERIFY_INTERVAL // 60} 分钟最多 {VERIFY_BATCH_SIZE} 个话题"
+        )
+
+
+async def _verify_job(context):
+    try:
+        await topic_health.verify(context.bot)
+    except Exception as e:
+        print(f"话题巡检任务失败: {e}")
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _verify_job,
+        interval=VERIFY_INTERVAL,
+        first=VERIFY_INTERVAL,
+        name="topic_health_verify",
+    )
+
+
+topic_health = TopicHealth()
@@ -0,0 +1,77 @@
+import asyncio
+from database import models as db
+from config import config
+
+PLACEHOLDER_TOPIC_NAME = "待分配话题"
+DEFAULT_POOL_SIZE = 3
+REFILL_INTERVAL = 60
+
+
+class TopicPool:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.available = 0
+        self.refill_task = None
+        self.refilling = False
+        self.stats = {'claimed': 0, 'misses': 0, 'stale': 0, 'created': 0}
+
+    async def claim(self) -> int:
+        async with self.lock:
+            thread_id = await db.claim_pooled_topic()
+        if thread_id is None:
+            self.stats['misses'] += 1
+            return None
+        self.available = max(0, self.available - 1)
+        self.stats['claimed'] += 1
+        return thread_id
+
+    def discard(self, thread_id: int):
+        self.stats['stale'] += 1
+        print(f"预建话题 {thread_id} 已失效，改为新建话题")
+
+    def schedule_refill(self, bot):
+        if self.refill_task is None or self.refill_task.done():
+            self.refill_task = asyncio.get_running_loop().create_task(self.refill(bot))
+
+    async def refill(self, bot):
+        if self.refilling or not config.FORUM_GROUP_ID:
+            return
+        self.refilling = True
+        try:
+            size = int(await db.get_setting('topic_pool_size', str(DEFAULT_POOL_SIZE)))
+            self.available = await db.get_pooled_topic_count()
+            while self.available < size:
+                topic = await bot.create_forum_topic(
+                    chat_id=config.FORUM_GROUP_ID,
+                    name=PLACEHOLDER_TOPIC_NAME
+                )
+                await db.add_pooled_topic(topic.message_thread_id)
+                self.available += 1
+                self.stats['created'] += 1
+        except Exception as e:
+            print(f"预建话题失败: {e}")
+        finally:
+            self.refilling = False
+
+    def get_report(self) -> str:
+        stats = self.stats
+        return (
+            f"预建话题: 可用 {self.available}, 已分配 {stats['claimed']}, 未命中 {stats['misses']}, "
+            f"失效 {stats['stale']}, 累计创建 {stats['created']}"
+        )
+
+
+async def _refill_job(context):
+    await topic_pool.refill(context.bot)
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _refill_job,
+        interval=REFILL_INTERVAL,
+        first=10,
+        name="topic_pool_refill",
+    )
+
+
+topic_pool = TopicPool()
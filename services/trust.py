@@ -0,0 +1,48 @@
+from datetime import datetime, timedelta
+from database import models as db
+
+DEFAULT_MIN_CLEAN_MESSAGES = 20
+DEFAULT_MIN_AGE_DAYS = 7
+SPAM_DECAY_FACTOR = 4
+
+
+class TrustService:
+    def __init__(self):
+        self.stats = {'fast_path': 0, 'blocking': 0, 'retro_clean': 0, 'retro_spam': 0}
+
+    async def is_trusted(self, user_data: dict) -> bool:
+        settings = await db.get_settings(['trust_fast_path_enabled', 'trust_min_clean_messages', 'trust_min_age_days'])
+        trusted = settings.get('trust_fast_path_enabled', '1') == '1' \
+            and (user_data.get('clean_messages') or 0) >= int(settings.get('trust_min_clean_messages', DEFAULT_MIN_CLEAN_MESSAGES)) \
+            and self._account_age(user_data) >= timedelta(days=float(settings.get('trust_min_age_days', DEFAULT_MIN_AGE_DAYS)))
+        self.stats['fast_path' if trusted else 'blocking'] += 1
+        return trusted
+
+    def _account_age(self, user_data: dict) -> timedelta:
+        try:
+            created_at = datetime.strptime(str(user_data.get('created_at'))[:19], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return timedelta(0)
+        return datetime.utcnow() - created_at
+
+    async def record_verdict(self, user_id: int, verdict: dict, retroactive: bool = False):
+        if verdict.get("is_spam"):
+            await db.decay_clean_messages(user_id, SPAM_DECAY_FACTOR)
+            if retroactive:
+                self.stats['retro_spam'] += 1
+        elif verdict.get("confidence"):
+            await db.increment_clean_messages(user_id)
+            if retroactive:
+                self.stats['retro_clean'] += 1
+
+    def get_report(self) -> str:
+        stats = self.stats
+        total = stats['fast_path'] + stats['blocking']
+        ratio = stats['fast_path'] / total * 100 if total else 0
+        return (
+            f"可信用户先转发: {stats['fast_path']} 次 ({ratio:.1f}%), "
+            f"事后审查通过 {stats['retro_clean']} 次, 撤回 {stats['retro_spam']} 次"
+        )
+
+
+trust_service = TrustService()
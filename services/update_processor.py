@@ -0,0 +1,125 @@
+import asyncio
+import time
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import config
+from database import models as db
+
+DEFAULT_QUEUE_SIZE = 1000
+MAX_TRACKED_UPDATES = 10000
+SETTINGS_REFRESH_INTERVAL = 60
+
+
+def _lane_key(update) -> tuple:
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    message = update.effective_message
+    if chat and chat.type != chat.PRIVATE and message and message.is_topic_message:
+        return ('thread', chat.id, message.message_thread_id)
+    if update.effective_user:
+        return ('user', update.effective_user.id)
+    if chat:
+        return ('chat', chat.id)
+    return None
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_workers: int, queue_timeout: float):
+        super().__init__(MAX_TRACKED_UPDATES)
+        self.max_workers = max(1, max_workers)
+        self.queue_timeout = queue_timeout
+        self.max_queue_size = DEFAULT_QUEUE_SIZE
+        self.workers = asyncio.Semaphore(self.max_workers)
+        self.lanes = {}
+        self.queued = 0
+        self.running = 0
+        self.stats = {'processed': 0, 'rejected': 0, 'timed_out': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def _shed(self, update, coroutine, reason: str):
+        coroutine.close()
+        self.stats[reason] += 1
+        message = update.message if isinstance(update, Update) else None
+        if message and message.chat.type == message.chat.PRIVATE:
+            try:
+                await message.reply_text("当前消息较多，您的这条消息未能处理，请稍后重新发送。")
+            except Exception as e:
+                print(f"发送繁忙提示失败: {e}")
+
+    async def do_process_update(self, update, coroutine):
+        if self.queued >= self.max_queue_size:
+            await self._shed(update, coroutine, 'rejected')
+            return
+
+        lane = _lane_key(update)
+        previous = self.lanes.get(lane) if lane else None
+        done = asyncio.get_running_loop().create_future()
+        if lane:
+            self.lanes[lane] = done
+
+        self.queued += 1
+        queued = True
+        try:
+            if previous:
+                await asyncio.shield(previous)
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self.workers.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.queued -= 1
+                queued = False
+                await self._shed(update, coroutine, 'timed_out')
+                return
+
+            self.queued -= 1
+            queued = False
+            waited = time.monotonic() - started
+            self.stats['wait_total'] += waited
+            self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.stats['processed'] += 1
+                self.workers.release()
+        finally:
+            if queued:
+                self.queued -= 1
+            done.set_result(None)
+            if lane and self.lanes.get(lane) is done:
+                del self.lanes[lane]
+
+    def get_report(self) -> str:
+        stats = self.stats
+        average = stats['wait_total'] / stats['processed'] * 1000 if stats['processed'] else 0
+        return (
+            f"并发: {self.running}/{self.max_workers}, 排队: {self.queued}/{self.max_queue_size}, 有序通道: {len(self.lanes)}\n"
+            f"已处理 {stats['processed']}, 队列满丢弃 {stats['rejected']}, 排队超时丢弃 {stats['timed_out']}\n"
+            f"平均等待 {average:.0f}ms, 最长 {stats['wait_max'] * 1000:.0f}ms"
+        )
+
+
+async def _refresh_settings_job(context):
+    try:
+        update_processor.max_queue_size = int(await db.get_setting('queue_max_size', str(DEFAULT_QUEUE_SIZE)))
+    except Exception as e:
+        print(f"读取更新队列设置失败: {e}")
+
+
+def setup(app):
+    app.job_queue.run_repeating(
+        _refresh_settings_job,
+        interval=SETTINGS_REFRESH_INTERVAL,
+        first=0,
+        name="update_processor_settings",
+    )
+
+
+update_processor = LaneUpdateProcessor(config.MAX_WORKERS, config.QUEUE_TIMEOUT)
@@ -2,15 +2,21 @@ import time
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from database import models as db
 from config import config
-from services.gemini_service import gemini_service
+from services.challenge_pool import challenge_pool
 
 pending_verifications = {}
 
+async def send_challenge(message, text: str, keyboard, image: bytes = None):
+    if image:
+        return await message.reply_photo(photo=image, caption=text, reply_markup=keyboard)
+    return await message.reply_text(text=text, reply_markup=keyboard)
+
 async def create_verification(user_id: int):
-    challenge = await gemini_service.generate_verification_challenge()
+    challenge = challenge_pool.take(allow_image=True)
     question = challenge['question']
     correct_answer = challenge['correct_answer']
     options = challenge['options']
+    image = challenge.get('image')
     
     existing_attempts = pending_verifications.get(user_id, {}).get('attempts', 0)
     
@@ -18,6 +24,7 @@ async def create_verification(user_id: int):
         'answer': correct_answer,
         'question': question,
         'options': options,
+        'image': image,
         'attempts': existing_attempts,
         'created_at': time.time()
     }
@@ -26,7 +33,7 @@ async def create_verification(user_id: int):
         [InlineKeyboardButton(option, callback_data=f"verify_{option}") for option in options]
     ]
     
-    return f"请完成人机验证: \n\n{question}", InlineKeyboardMarkup(keyboard)
+    return f"请完成人机验证: \n\n{question}", InlineKeyboardMarkup(keyboard), image
 
 async def verify_answer(user_id: int, answer: str):
     if user_id not in pending_verifications:
@@ -55,15 +62,17 @@ async def verify_answer(user_id: int, answer: str):
         )
         return False, message, True, None
     
-    challenge = await gemini_service.generate_verification_challenge()
+    challenge = challenge_pool.take(allow_image=True)
     new_question = challenge['question']
     new_correct_answer = challenge['correct_answer']
     new_options = challenge['options']
+    new_image = challenge.get('image')
     
     pending_verifications[user_id] = {
         'answer': new_correct_answer,
         'question': new_question,
         'options': new_options,
+        'image': new_image,
         'attempts': verification['attempts'],
         'created_at': time.time()
     }
@@ -73,7 +82,7 @@ async def verify_answer(user_id: int, answer: str):
     ]
     
     new_question_text = f"请完成人机验证: \n\n{new_question}"
-    return False, f"答案错误，还有 {config.MAX_VERIFICATION_ATTEMPTS - verification['attempts']} 次机会。", False, (new_question_text, InlineKeyboardMarkup(keyboard))
+    return False, f"答案错误，还有 {config.MAX_VERIFICATION_ATTEMPTS - verification['attempts']} 次机会。", False, (new_question_text, InlineKeyboardMarkup(keyboard), new_image)
 
 def is_verification_pending(user_id: int) -> tuple[bool, bool]:
     if user_id not in pending_verifications:
@@ -105,4 +114,4 @@ def get_pending_verification_message(user_id: int):
         [InlineKeyboardButton(option, callback_data=f"verify_{option}") for option in options]
     ]
     
-    return question, InlineKeyboardMarkup(keyboard)
+    return question, InlineKeyboardMarkup(keyboard), verification.get('image')
@@ -1,14 +1,46 @@
 from PIL import Image
+import hashlib
 import io
 
-async def sticker_to_image(file: bytes) -> bytes:
+JPEG_QUALITY_STEPS = (85, 70, 55, 40)
+
+def select_photo_size(photo_sizes, max_side: int):
+    ordered = sorted(photo_sizes, key=lambda size: size.width * size.height)
+    for size in ordered:
+        if max(size.width, size.height) >= max_side:
+            return size
+    return ordered[-1]
+
+def prepare_image(data: bytes, max_side: int, byte_budget: int) -> tuple:
+    image_bytes = downscale_image(data, max_side, byte_budget)
+    if not image_bytes:
+        return None, None
+    return image_bytes, hashlib.sha1(image_bytes).hexdigest()
+
+def downscale_image(data: bytes, max_side: int, byte_budget: int) -> bytes:
     try:
-        with Image.open(io.BytesIO(file)) as img:
+        with Image.open(io.BytesIO(data)) as img:
+            source_format, source_size = img.format, img.size
+            if source_format == 'JPEG':
+                img.draft('RGB', (max_side, max_side))
             if img.mode != 'RGB':
                 img = img.convert('RGB')
-            output_buffer = io.BytesIO()
-            img.save(output_buffer, format='PNG')
-            return output_buffer.getvalue()
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+            while True:
+                for quality in JPEG_QUALITY_STEPS:
+                    output_buffer = io.BytesIO()
+                    img.save(output_buffer, format='JPEG', quality=quality, optimize=True)
+                    if output_buffer.tell() <= byte_budget:
+                        break
+                if output_buffer.tell() <= byte_budget or max(img.size) <= 256:
+                    break
+                img = img.resize((max(1, img.width * 3 // 4), max(1, img.height * 3 // 4)), Image.LANCZOS)
+
+            result = output_buffer.getvalue()
+            if source_format == 'JPEG' and len(data) <= len(result) and max(source_size) <= max_side:
+                return bytes(data)
+            return result
     except Exception as e:
-        print(f"Error converting sticker to image: {e}")
+        print(f"Error downscaling image: {e}")
         return None
@@ -1,14 +1,24 @@
-from telegram import Update
+from telegram import Update, ReplyParameters, InputMediaPhoto, InputMediaVideo, InputMediaDocument, InputMediaAudio
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from config import config
 
-async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_web_page_preview=False):
+COPY_MESSAGES_LIMIT = 100
+
+def _reply_parameters(reply_to_message_id):
+    if not reply_to_message_id:
+        return None
+    return ReplyParameters(message_id=reply_to_message_id, allow_sending_without_reply=True)
+
+async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_web_page_preview=False, reply_to_message_id=None):
+    reply_parameters = _reply_parameters(reply_to_message_id)
     if message.text:
         return await bot.send_message(
             chat_id=chat_id,
             text=message.text,
             entities=message.entities,
             message_thread_id=thread_id,
+            reply_parameters=reply_parameters,
             disable_web_page_preview=disable_web_page_preview
         )
     elif message.photo:
@@ -17,7 +27,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             photo=message.photo[-1].file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.animation:
         return await bot.send_animation(
@@ -25,7 +36,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             animation=message.animation.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.video:
         return await bot.send_video(
@@ -33,7 +45,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             video=message.video.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.document:
         return await bot.send_document(
@@ -41,7 +54,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             document=message.document.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.audio:
         return await bot.send_audio(
@@ -49,7 +63,8 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             audio=message.audio.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.voice:
         return await bot.send_voice(
@@ -57,19 +72,139 @@ async def send_message_by_type(bot, message, chat_id, thread_id=None, disable_we
             voice=message.voice.file_id,
             caption=message.caption,
             caption_entities=message.caption_entities,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.video_note:
         return await bot.send_video_note(
             chat_id=chat_id,
             video_note=message.video_note.file_id,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     elif message.sticker:
         return await bot.send_sticker(
             chat_id=chat_id,
             sticker=message.sticker.file_id,
-            message_thread_id=thread_id
+            message_thread_id=thread_id,
+            reply_parameters=reply_parameters
         )
     return None
 
+
+def build_input_media(message):
+    if message.photo:
+        media_type, file_id = InputMediaPhoto, message.photo[-1].file_id
+    elif message.video:
+        media_type, file_id = InputMediaVideo, message.video.file_id
+    elif message.document:
+        media_type, file_id = InputMediaDocument, message.document.file_id
+    elif message.audio:
+        media_type, file_id = InputMediaAudio, message.audio.file_id
+    else:
+        return None
+    return media_type(
+        media=file_id,
+        caption=message.caption,
+        caption_entities=message.caption_entities
+    )
+
+async def send_media_group_by_messages(bot, messages, chat_id, thread_id=None):
+    media = [build_input_media(message) for message in messages]
+    media = [item for item in media if item is not None]
+    if not media:
+        return []
+    return await bot.send_media_group(
+        chat_id=chat_id,
+        media=media,
+        message_thread_id=thread_id
+    )
+
+def _is_missing_thread(error: BadRequest) -> bool:
+    error_text = error.message.lower()
+    return "thread not found" in error_text or "topic not found" in error_text
+
+async def relay_message(bot, message, chat_id, thread_id=None, disable_web_page_preview=False, reply_to_message_id=None):
+    try:
+        return await bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=message.chat_id,
+            message_id=message.message_id,
+            message_thread_id=thread_id,
+            reply_parameters=_reply_parameters(reply_to_message_id)
+        )
+    except BadRequest as e:
+        if _is_missing_thread(e):
+            raise
+        print(f"复制消息失败，改为按类型重新发送: {e}")
+    return await send_message_by_type(bot, message, chat_id, thread_id, disable_web_page_preview, reply_to_message_id)
+
+async def relay_messages(bot, messages, chat_id, thread_id=None) -> dict:
+    messages = sorted(messages, key=lambda message: message.message_id)
+    source_ids = [message.message_id for message in messages]
+    try:
+        sent = await bot.copy_messages(
+            chat_id=chat_id,
+            from_chat_id=messages[0].chat_id,
+            message_ids=source_ids,
+            message_thread_id=thread_id
+        )
+    except BadRequest as e:
+        if _is_missing_thread(e):
+            raise
+        print(f"批量复制消息失败，改为按类型重新发送: {e}")
+        sent = await send_media_group_by_messages(bot, messages, chat_id, thread_id)
+
+    if len(sent) != len(source_ids):
+        return {}
+    return {source_id: copied.message_id for source_id, copied in zip(source_ids, sent)}
+
+async def sync_edit(bot, message, chat_id, target_message_id):
+    if message.text:
+        return await bot.edit_message_text(
+            chat_id=chat_id,
+            message_id=target_message_id,
+            text=message.text,
+            entities=message.entities
+        )
+    return await bot.edit_message_caption(
+        chat_id=chat_id,
+        message_id=target_message_id,
+        caption=message.caption,
+        caption_entities=message.caption_entities
+    )
+
+async def relay_message_ids(bot, from_chat_id, message_ids, chat_id, thread_id=None) -> dict:
+    message_ids = sorted(message_ids)
+    copied = {}
+    for start in range(0, len(message_ids), COPY_MESSAGES_LIMIT):
+        chunk = message_ids[start:start + COPY_MESSAGES_LIMIT]
+        try:
+            sent = await bot.copy_messages(
+                chat_id=chat_id,
+                from_chat_id=from_chat_id,
+                message_ids=chunk,
+                message_thread_id=thread_id
+            )
+            if len(sent) == len(chunk):
+                copied.update({source_id: copy.message_id for source_id, copy in zip(chunk, sent)})
+            continue
+        except BadRequest as e:
+            if _is_missing_thread(e):
+                raise
+            print(f"批量复制消息失败，改为逐条复制: {e}")
+
+        for message_id in chunk:
+            try:
+                sent = await bot.copy_message(
+                    chat_id=chat_id,
+                    from_chat_id=from_chat_id,
+                    message_id=message_id,
+                    message_thread_id=thread_id
+                )
+                copied[message_id] = sent.message_id
+            except BadRequest as e:
+                if _is_missing_thread(e):
+                    raise
+                print(f"复制消息 {message_id} 失败: {e}")
+    return copied